@@ -24,8 +24,8 @@ source_suffix = '.rst'
 master_doc = 'index'
 project = u'LAF Fabric'
 copyright = u'2013, Dirk Roorda'
-version = '4.8'
-release = '4.8.4'
+version = '4.9'
+release = '4.9'
 exclude_patterns = ['_build']
 add_function_parentheses = True
 add_module_names = False
@@ -53,9 +53,8 @@ class FeatureDoc(object):
         msg = self.API['msg']
         outfile = self.API['outfile']
         F = self.API['F']
-        FE = self.API['FE']
         NN = self.API['NN']
-        EE = self.API['EE']
+        ET = self.API['ET']
         msg = self.API['msg']
         outfile = self.API['outfile']
         my_file = self.API['my_file']
@@ -99,23 +98,13 @@ class FeatureDoc(object):
                         vals_def[ft][val] += 1
         msg("{:>7} nodes done".format(i))
 
-        ci = 0
-        i = 0
-        for edge in EE():
-            i += 1
-            ci += 1
-            if ci == chunk_size:
-                ci = 0
-                msg("{:>7} edges done".format(i))
-            for ft in edge_feats:
-                val = FE.item[ft].v(edge[0])
-                if val != None:
-                    otype_from = F.db_otype.v(edge[1])
-                    otype_to = F.db_otype.v(edge[2])
-                    e_otypes[(otype_from, otype_to)][ft] += 1
-                    e_otypesi[ft][(otype_from, otype_to)] += 1
-                    vals[ft][val] += 1
-        msg("{:>7} edges done".format(i))
+        for ft in edge_feats:
+            table = ET(ft, node_features=('db_otype',))
+            for (otypes, n) in collections.Counter(zip(table['from.db_otype'], table['to.db_otype'])).items():
+                e_otypes[otypes][ft] += n
+                e_otypesi[ft][otypes] += n
+            for (val, n) in collections.Counter(table['value']).items(): vals[ft][val] += n
+            msg("{:>7} edges with {} done".format(len(table['edge']), ft))
         
         node_otypes = sorted(n_otypes.keys())
         edge_otypes = sorted(e_otypes.keys())
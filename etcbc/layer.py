@@ -1,44 +1,121 @@
+import array
+import bisect
+import itertools
+from .lib import otypes
+
+def layer_pack_up(n_node, up):
+    '''Pack the containers per object type into one array.
+
+    ``up[r]`` is ``None`` or an array with for each node the container of type ``otypes[r]`` plus one, 0 if there is none.
+    The packed array is ``n_node, k, t1, ..., tk`` followed by the ``k`` arrays for the types with index ``t1, ..., tk``.
+    '''
+    present = [r for r in range(len(up)) if up[r] != None]
+    packed = array.array('I', [n_node, len(present)] + present)
+    for r in present: packed.extend(up[r])
+    return packed
+
+def layer_pack_down(n_node, down):
+    '''Pack the contained nodes per object type into one array.
+
+    ``down[r]`` is a pair of arrays of containers and the nodes of type ``otypes[r]`` they contain, in canonical order.
+    The packed array is ``n_node, k, t1, ..., tk`` followed by, for each of these types,
+    ``n_node + 1`` offsets and the contained nodes: the nodes contained in ``n`` are between offsets ``n`` and ``n + 1``.
+    '''
+    present = [r for r in range(len(down)) if len(down[r][0])]
+    packed = array.array('I', [n_node, len(present)] + present)
+    for r in present:
+        (containers, children) = down[r]
+        counts = array.array('I', [0]) * (n_node + 1)
+        for c in containers: counts[c + 1] += 1
+        offsets = array.array('I', itertools.accumulate(counts))
+        slots = offsets[0:n_node]
+        members = array.array('I', [0]) * len(children)
+        for (c, m) in zip(containers, children):
+            members[slots[c]] = m
+            slots[c] += 1
+        packed.extend(offsets)
+        packed.extend(members)
+    return packed
+
+def layer_up(packed):
+    '''Unpack the result of ``layer_pack_up`` into a dict of arrays keyed by object type, without copying.'''
+    data = memoryview(packed)
+    (n_node, k) = packed[0:2]
+    start = 2 + k
+    up = {}
+    for r in packed[2:start]:
+        up[otypes[r]] = data[start:start + n_node]
+        start += n_node
+    return up
+
+def layer_down(packed):
+    '''Unpack the result of ``layer_pack_down`` into a dict of (offsets, nodes) pairs keyed by object type, without copying.'''
+    data = memoryview(packed)
+    (n_node, k) = packed[0:2]
+    start = 2 + k
+    down = {}
+    for r in packed[2:start]:
+        offsets = data[start:start + n_node + 1]
+        start += n_node + 1
+        down[otypes[r]] = (offsets, data[start:start + offsets[n_node]])
+        start += offsets[n_node]
+    return down
+
 class Layer(object):
     '''Layering of MQL objects.
 
     ``up(otype, n)`` is the node of MQL type ``otype`` that acts as container of node ``n``.
     In this way you can get e.g. for each subphrase and phrase_atom the book, chapter, half_verse and sentence_atom in which it occurs.
     ``down(otype, n)`` is the converse of ``up()``: it delivers an ordered list of nodes of MQL type ``otype`` contained in node ``n``.
+
+    The data is stored in arrays: for ``up`` one array per type with the container plus one for each node,
+    for ``down`` per type an array of offsets into an array of contained nodes.
     '''
     def __init__(self, lafapi):
         lafapi.api['fabric'].load_again({"features": ('db.otype sft.book sft.chapter sft.verse number', '')}, add=True, verbose='INFO')
-        self.up = lafapi.data_items['zL00(node_up)']
-        self.down = lafapi.data_items['zL00(node_down)']
+        self.up = layer_up(lafapi.data_items['zL00(node_up)'])
+        self.down = layer_down(lafapi.data_items['zL00(node_down)'])
+        self.numbered = lafapi.data_items['zV00(passages)']['numbered']
+        self.node_sort_inv = lafapi.data_items['zG00(node_sort_inv)']
         self.lafapi = lafapi
 
-    def u(self, tp, n): return self.up.get(tp, {}).get(n, None)
-    def d(self, tp, n): return self.down.get(tp, {}).get(n, None)
+    def u(self, tp, n):
+        up = self.up.get(tp, None)
+        if up == None: return None
+        c = up[n]
+        return c - 1 if c else None
+
+    def d(self, tp, n):
+        down = self.down.get(tp, None)
+        if down == None: return None
+        (offsets, members) = down
+        return members[offsets[n]:offsets[n + 1]].tolist() or None
+
+    def inside(self, tp, val, n):
+        '''The nodes of type ``tp`` with number ``val`` that are contained in node ``n``, in canonical order.'''
+        (starts, nodes) = self.numbered.get(tp, {}).get(None if val == None else str(val), ((), ()))
+        (offsets, words) = self.down['word']
+        if offsets[n] == offsets[n + 1]: return []
+        lo = bisect.bisect_left(starts, self.node_sort_inv[words[offsets[n]]])
+        hi = bisect.bisect_right(starts, self.node_sort_inv[words[offsets[n + 1] - 1]], lo)
+        ntp = self.lafapi.api['F'].db_otype.v(n)
+        return [m for m in nodes[lo:hi] if self.u(ntp, m) == n]
+
     def p(self, tp, book=None, chapter=None, verse=None, sentence=None, clause=None, phrase=None):
-        F = self.lafapi.api['F']
-        drill_nodes = list(F.db_otype.s('book'))
-        first_step = True
-        for (rtp, val, feat) in (
-            ('book', book, F.sft_book.v),
-            ('chapter', chapter, F.sft_chapter.v),
-            ('verse', verse, F.sft_verse.v),
-            ('sentence', sentence, F.number.v),
-            ('clause', clause, F.number.v),
-            ('phrase', phrase, F.number.v),
+        if book == None: drill_nodes = list(self.lafapi.api['F'].db_otype.s('book'))
+        else: drill_nodes = list(self.numbered['book'].get(str(book), ((), ()))[1])
+        for (rtp, val) in (
+            ('chapter', chapter),
+            ('verse', verse),
+            ('sentence', sentence),
+            ('clause', clause),
+            ('phrase', phrase),
         ):
-            if first_step:
-                if val == None: new_drill_nodes = drill_nodes
-                else:
-                    new_drill_nodes = [n for n in drill_nodes if feat(n) == str(val)]
-                first_step = False
-            else:
-                if val == None: new_drill_nodes = drill_nodes
-                else:
-                    new_drill_nodes = []
-                    for n in drill_nodes:
-                        new_drill_nodes += [m for m in self.down.get(rtp, {}).get(n, []) if feat(m) == str(val)]
+            if val == None: continue
+            new_drill_nodes = []
+            for n in drill_nodes: new_drill_nodes += self.inside(rtp, val, n)
             drill_nodes = new_drill_nodes
         new_drill_nodes = []
         for n in drill_nodes:
-            new_drill_nodes += [m for m in self.down.get(tp, {}).get(n, [])]
+            new_drill_nodes += self.d(tp, n) or []
         return new_drill_nodes
-
@@ -1,4 +1,6 @@
 import re
+import bisect
+import functools
 import unicodedata
 
 class Transcription(object):
@@ -104,14 +106,13 @@ class Transcription(object):
     }
     hebrew_cons = '>BGDHWZXVJKLMNS<PYQRFCT'
     trans_final_pat = re.compile(r'([' + hebrew_cons + r'][^_&]*)([KMNPY])([^' + hebrew_cons + r'_&]*(:?[_&]|\Z))')
-    trans_hebrew_pat = re.compile(r'(:[AE@]|.[cf]|:|[0-9][0-9]|.)')
+    trans_hebrew_pat = re.compile(r'(:[AE@]|.[cf]|[0-9][0-9])')
     swap_accent_pat = re.compile(r'(\A|[_&])([0-9][0-9])([' + hebrew_cons + r'])([:;,.EAIOU@]*)')
-    remove_accent_pat = re.compile(r'((?:[0-9][0-9])|[,*])')
-    remove_point_pat  = re.compile(r'((?:[0-9][0-9])|(?:\.[cf])|(?::[@AE])|[,.:;@AEIOU*])')
+    remove_accent_pat = re.compile(r'[0-9][0-9]|[,*]')
+    remove_point_pat  = re.compile(r'[0-9][0-9]|\.[cf]|:[@AE]|[,.:;@AEIOU*]')
+    keep_marks = {'00': '00', '05': '05'} # sof pasuq and paseq survive removal
     remove_psn_pat = re.compile(r'00[ _SPNÑñ]*')
     remove_psq_pat = re.compile(r'(?:[ _]+05[ _]*)|(?:05[ _]+)')
-    shin_pat = re.compile(r'[CF]')
-    ph_simple_pat = re.compile(r'([ˈˌᵊᵃᵒᵉāo*])')
     noorigspace = re.compile('''
           (?: [&-]\Z)           # space, maqef or nospace
         | (?: 
@@ -150,13 +151,23 @@ class Transcription(object):
         'p': "\u0727", # pe reversed
     }
 
+    hebrew_mappingi = dict((v,k) for (k,v) in hebrew_mapping.items() if k != '')
+    # special treatment needed for nun hafukha, since it is consists of two characters 
+    hebrew_mappingi['\u05C6'] = 'ñ'
+    hebrew_mappingi['\u0307'] = ''
+    syriac_mappingi = dict((v,k) for (k,v) in syriac_mapping.items())
+
+    hebrew_table = str.maketrans(dict((k, v) for (k, v) in hebrew_mapping.items() if len(k) == 1))
+    hebrew_tablei = str.maketrans(dict((k, v) for (k, v) in hebrew_mappingi.items() if len(k) == 1))
+    syriac_table = str.maketrans(syriac_mapping)
+    syriac_tablei = str.maketrans(syriac_mappingi)
+    shin_table = str.maketrans('CF', '##')
+    ph_simple_table = str.maketrans({'ˈ': None, 'ˌ': None, 'ᵊ': None, 'ᵃ': None, 'ᵒ': None, 'ᵉ': None, '*': None, 'ā': 'å', 'o': 'å'})
+    memo_size = 1 << 17
+
     def __init__(self):
         self.hebrew_consonants = {Transcription.hebrew_mapping[x] for x in Transcription.hebrew_cons}
         self.hebrew_consonants.add('\u05E9')
-        self.hebrew_mappingi = dict((v,k) for (k,v) in Transcription.hebrew_mapping.items() if k != '')
-        # special treatment needed for nun hafukha, since it is consists of two characters 
-        self.hebrew_mappingi['\u05C6'] = 'ñ'
-        self.hebrew_mappingi['\u0307'] = ''
 
     def _comp(s):
         for (d, c) in Transcription.decomp.items(): s = s.replace(d, c)
@@ -165,6 +176,8 @@ class Transcription(object):
         for (d, c) in Transcription.decomp.items(): s = s.replace(c, d)
         return s
 
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
     def suffix_and_finales(word):
         # first split the word proper from the suffix, and add a space if there is no other suffix
         add_space = ''
@@ -205,47 +218,72 @@ class Transcription(object):
         return (new_word, suffix + add_space)
 
     def _map_final(m): return m.group(1) + m.group(2).lower() + m.group(3)
-    def _map_hebrew(m): return Transcription.hebrew_mapping.get(m.group(1), m.group(1))
     def _swap_accent(m): return m.group(1) + m.group(3) + m.group(4) + m.group(2)
-    def _remove_accent(m): return '00' if m.group(1) == '00' else '05' if m.group(1) == '05' else ''
-    def _remove_point(m):  return '00' if m.group(1) == '00' else '05' if m.group(1) == '05' else ''
-    def _ph_simple(m): return 'å' if m.group(1) in 'āo' else ''
+    def _remove_mark(m): return Transcription.keep_marks.get(m.group(), '')
 
-# return unicodedata.normalize('NFKD', Transcription.trans_hebrew_pat.sub(Transcription._map_hebrew, nword))
+# return unicodedata.normalize('NFKD', Transcription.to_hebrew_x(nword))
 # unicode normalization is harmful if there is a combination of dagesh, vowel and accent.
 
+# The conversions below are remembered per word (the least recently used ones are forgotten).
+# The one-to-one parts of the mappings are done by translation tables; for Hebrew the word is split
+# on the tokens of more than one character, which are looked up in the mapping.
+
     def suppress_space(word):
         return Transcription.noorigspace.search(word)
 
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
     def to_etcbc_v(word):
-        return Transcription.remove_accent_pat.sub(Transcription._remove_accent, word)
+        return Transcription.remove_accent_pat.sub(Transcription._remove_mark, word)
 
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
     def to_etcbc_c(word):
-        word = Transcription.remove_point_pat.sub(Transcription._remove_point, word)
+        word = Transcription.remove_point_pat.sub(Transcription._remove_mark, word)
         word = Transcription.remove_psn_pat.sub('00', word) # remove nun hafukha, setumah, petuhah at the end of a verse
         word = Transcription.remove_psq_pat.sub(' ', word) # replace paseq with attached spaces by single space
         word = word.upper() # no final forms of consonants
-        return Transcription.shin_pat.sub('#', word)
+        return word.translate(Transcription.shin_table)
 
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
     def to_hebrew(word):
-        word = Transcription.swap_accent_pat.sub(Transcription._swap_accent, word)
-        return Transcription.trans_hebrew_pat.sub(Transcription._map_hebrew, word)
+        return Transcription.to_hebrew_x(Transcription.swap_accent_pat.sub(Transcription._swap_accent, word))
 
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
     def to_hebrew_v(word):
-        return Transcription.trans_hebrew_pat.sub(Transcription._map_hebrew, Transcription.to_etcbc_v(word))
+        return Transcription.to_hebrew_x(Transcription.to_etcbc_v(word))
 
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
     def to_hebrew_c(word):
-        return Transcription.trans_hebrew_pat.sub(Transcription._map_hebrew, Transcription.to_etcbc_c(word))
+        return Transcription.to_hebrew_x(Transcription.to_etcbc_c(word))
 
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
     def to_hebrew_x(word):
-        return Transcription.trans_hebrew_pat.sub(Transcription._map_hebrew, word)
+        parts = Transcription.trans_hebrew_pat.split(word)
+        if len(parts) == 1: return word.translate(Transcription.hebrew_table)
+        return ''.join([x.translate(Transcription.hebrew_table) if i % 2 == 0 else Transcription.hebrew_mapping.get(x, x) for (i, x) in enumerate(parts)])
 
-    def ph_simplify(pword): return Transcription.ph_simple_pat.sub(Transcription._ph_simple, pword)
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
+    def ph_simplify(pword): return pword.translate(Transcription.ph_simple_table)
 
-    def from_hebrew(self, word): return ''.join(self.hebrew_mappingi.get(x, x) for x in Transcription._comp(word))
-    def to_syriac(self, word): return Transcription._decomp(''.join(self.syriac_mapping.get(x, x) for x in Transcription._comp(word)))
-    def from_syriac(self, word): return ''.join(self.syriac_mappingi.get(x, x) for x in Transcription._comp(word))
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
+    def _from_hebrew(word): return Transcription._comp(word).translate(Transcription.hebrew_tablei)
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
+    def _to_syriac(word): return Transcription._decomp(Transcription._comp(word).translate(Transcription.syriac_table))
+    @staticmethod
+    @functools.lru_cache(maxsize=memo_size)
+    def _from_syriac(word): return Transcription._comp(word).translate(Transcription.syriac_tablei)
 
+    def from_hebrew(self, word): return Transcription._from_hebrew(word)
+    def to_syriac(self, word): return Transcription._to_syriac(word)
+    def from_syriac(self, word): return Transcription._from_syriac(word)
 
 def monad_set(monadsrep):
     monads = set()
@@ -256,6 +294,127 @@ def monad_set(monadsrep):
         else: monads.add(int(bounds[0]))
     return monads
 
+def monad_ranges(monadsrep):
+    '''The monad set representation as a tuple of maximal ranges ``(first, last)``, in ascending order.'''
+    ranges = []
+    for rng in monadsrep.split(','):
+        bounds = rng.split('-')
+        (first, last) = (int(bounds[0]), int(bounds[-1]))
+        if ranges and first <= ranges[-1][1] + 1: ranges[-1] = (ranges[-1][0], max(last, ranges[-1][1]))
+        else: ranges.append((first, last))
+    return tuple(ranges)
+
+def ranges_within(inner, outer):
+    '''Whether the monads of the ranges ``inner`` are all in the ranges ``outer``.'''
+    j = 0
+    for (first, last) in inner:
+        while j < len(outer) and outer[j][1] < first: j += 1
+        if j == len(outer) or outer[j][0] > first or outer[j][1] < last: return False
+    return True
+
+class MonadSet(object):
+    '''Set of monads, represented by its maximal ranges ``(first, last)`` in ascending order.
+
+    ``MonadSet.parse(monadsrep)`` makes a monad set out of a string such as ``1-3,7``, with a cache on the string.
+    ``MonadSet.from_monads(monads)`` and ``MonadSet.union(*monadsets)`` make monad sets out of monads and monad sets.
+    Monad sets support ``len()``, ``in``, iteration, ``==``, ``<=``, ``<``, ``>=``, ``>`` and ``|``.
+    ``min()`` and ``max()`` give the first and last monad,
+    ``min_difference(other)`` the first monad that is not in ``other`` (``None`` if there is none).
+    ``before(other)`` compares monad sets as the ``MK`` key does: supersets first, otherwise the set with
+    the first monad not in the other comes first. ``sort_key()`` is a tuple with the same ordering.
+    '''
+    __slots__ = ('ranges',)
+    beyond = float('inf')
+
+    def __init__(self, ranges=()): self.ranges = tuple(ranges)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1 << 16)
+    def parse(monadsrep): return MonadSet(monad_ranges(monadsrep))
+
+    @staticmethod
+    def from_monads(monads):
+        ranges = []
+        for m in sorted(monads):
+            if ranges and m <= ranges[-1][1] + 1: ranges[-1][1] = max(m, ranges[-1][1])
+            else: ranges.append([m, m])
+        return MonadSet(tuple(r) for r in ranges)
+
+    @staticmethod
+    def union(*monadsets):
+        ranges = []
+        for (first, last) in sorted(r for ms in monadsets for r in ms.ranges):
+            if ranges and first <= ranges[-1][1] + 1: ranges[-1][1] = max(last, ranges[-1][1])
+            else: ranges.append([first, last])
+        return MonadSet(tuple(r) for r in ranges)
+
+    def __repr__(self): return "MonadSet.parse('{}')".format(self)
+    def __str__(self): return ','.join(str(f) if f == l else '{}-{}'.format(f, l) for (f, l) in self.ranges)
+    def __hash__(self): return hash(self.ranges)
+    def __eq__(self, other): return isinstance(other, MonadSet) and self.ranges == other.ranges
+    def __ne__(self, other): return not self == other
+    def __le__(self, other): return ranges_within(self.ranges, other.ranges)
+    def __lt__(self, other): return self.ranges != other.ranges and ranges_within(self.ranges, other.ranges)
+    def __ge__(self, other): return ranges_within(other.ranges, self.ranges)
+    def __gt__(self, other): return self.ranges != other.ranges and ranges_within(other.ranges, self.ranges)
+    def __or__(self, other): return MonadSet.union(self, other)
+    def __bool__(self): return len(self.ranges) > 0
+    def __len__(self): return sum(l - f + 1 for (f, l) in self.ranges)
+
+    def __iter__(self):
+        for (f, l) in self.ranges:
+            for m in range(f, l + 1): yield m
+
+    def __contains__(self, m):
+        i = bisect.bisect_right(self.ranges, (m, MonadSet.beyond))
+        return i > 0 and self.ranges[i - 1][1] >= m
+
+    def min(self):
+        if not self.ranges: raise ValueError('min() of an empty monad set')
+        return self.ranges[0][0]
+
+    def max(self):
+        if not self.ranges: raise ValueError('max() of an empty monad set')
+        return self.ranges[-1][1]
+
+    def min_difference(self, other):
+        outer = other.ranges
+        j = 0
+        for (first, last) in self.ranges:
+            m = first
+            while m <= last:
+                while j < len(outer) and outer[j][1] < m: j += 1
+                if j == len(outer) or outer[j][0] > m: return m
+                m = outer[j][1] + 1
+        return None
+
+    def before(self, other):
+        if self.ranges == other.ranges: return 0
+        if self <= other: return 1
+        if other <= self: return -1
+        return -1 if self.min_difference(other) < other.min_difference(self) else 1
+
+    def sort_key(self):
+        key = []
+        for (first, last) in self.ranges: key.extend((first, -last))
+        key.append(MonadSet.beyond)
+        return tuple(key)
+
+otypes = (
+    'book',
+    'chapter',
+    'verse',
+    'half_verse',
+    'sentence',
+    'sentence_atom',
+    'clause',
+    'clause_atom',
+    'phrase',
+    'phrase_atom',
+    'subphrase',
+    'word',
+)
+
 object_rank = {
     'book': -4,
     'chapter': -3,
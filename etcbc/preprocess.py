@@ -1,46 +1,23 @@
 import collections
-import functools
 import array
-from .lib import monad_set, object_rank
-from .layer import Layer
+from .lib import MonadSet, object_rank, otypes
+from .layer import Layer, layer_pack_up, layer_pack_down, layer_up, layer_down
 from .text import Text
 
 ETCBCREF = 'http://laf-fabric.readthedocs.org/en/latest/texts/ETCBC-reference.html'
 
-otypes = (
-    'book',
-    'chapter',
-    'verse',
-    'half_verse',
-    'sentence',
-    'sentence_atom',
-    'clause',
-    'clause_atom',
-    'phrase',
-    'phrase_atom',
-    'subphrase',
-    'word',
-)
-
 def node_order(API):
-    API['fabric'].load_again({"features": ('db.otype db.monads db.minmonad db.maxmonad', '')}, add=True)
+    '''The ETCBC canonical order of nodes.
+
+    Of two objects, the one with the smallest monad that is not in the other comes first,
+    a superset comes before its subsets, and objects with the same monads are ordered by type.
+    This is the order of the sort key of the monad set followed by the object rank.
+    '''
     msg = API['msg']
     F = API['F']
     NN = API['NN']
+    def etcbckey(n): return MonadSet.parse(F.db_monads.v(n)).sort_key() + (object_rank[F.db_otype.v(n)],)
 
-    def before(a,b):
-        sa = monad_set(F.db_monads.v(a))
-        sb = monad_set(F.db_monads.v(b))
-        oa = object_rank[F.db_otype.v(a)]
-        ob = object_rank[F.db_otype.v(b)]
-        if sa == sb: return 0 if oa == ob else -1 if oa < ob else 1
-        if sa < sb: return 1
-        if sa > sb: return -1
-        am = min(sa - sb)
-        bm = min(sb - sa)
-        return -1 if am < bm else 1 if bm < am else None
-
-    etcbckey = functools.cmp_to_key(before)
     msg('SORTING nodes ...')
     nodes = sorted(NN(), key=etcbckey)
     return array.array('I', nodes)
@@ -53,91 +30,125 @@ def node_order_inv(API):
     return make_array_inverse(data_items['zG00(node_sort)'])
 
 
-Lu = {}
-Ld = {}
-
-def getmonads(attr):
-    ranges = attr.split(',')
-    covered = set()
-    for r in ranges:
-        if '-' in r:
-            (start, end) = r.split('-', 1)
-            for i in range(int(start), int(end)+1): covered.add(i)
-        else:
-            covered.add(int(r))
-    return covered
-
-def fill(NN, F, er, ed):
-    cur_min = None
-    cur_max = None
-    cur_ers = collections.deque()
-    skip_ed = None
-    for n in NN():
-        otype = F.db_otype.v(n)
-        if otype == er:
-            this_er = n
-            this_min = int(F.db_minmonad.v(n))
-            this_max = int(F.db_maxmonad.v(n))
-            this_monads = getmonads(F.db_monads.v(n))
-            while len(cur_ers):
-                if cur_ers[0][2] < this_min:
-                    cur_ers.popleft()
-                else:
-                    break
-            cur_ers.append((this_er, this_min, this_max, this_monads))
-            cur_max = max(x[2] for x in cur_ers)
-            cur_min = min(x[1] for x in cur_ers)
-            skip_ed = False
-        elif otype in ed:
-            if len(cur_ers) > 0:
-                if not skip_ed:
-                    this_min = int(F.db_minmonad.v(n))
-                    this_max = int(F.db_maxmonad.v(n))
-                if this_min > cur_max:
-                    skip_ed = True
-                if this_max <= cur_max:
-                    this_monads = getmonads(F.db_monads.v(n))
-                    for (that_er, that_min, that_max, that_monads) in cur_ers:
-                        if  this_monads <= that_monads:
-                            Lu.setdefault(er, {})[n] = that_er
-                            Ld.setdefault(otype, {}).setdefault(that_er, []).append(n)
+# node_up and node_down are computed in one go. The down arrays that node_up computes are handed over to node_down,
+# which depends on node_up and so is prepared right after it. They are only taken if they belong to the same node order.
+down_handover = {}
 
 def node_ud(API):
-    API['fabric'].load_again({"features": ('db.otype db.monads db.minmonad db.maxmonad', '')}, add=True)
+    '''Containment between objects of different types, in one pass over the nodes in canonical order.
+
+    For each type there is a queue of the objects of that type that have been seen and whose monads may
+    still contain later objects. An object is contained in a candidate container if the candidate's
+    span ``minmonad``-``maxmonad`` covers it, and, if the candidate has gaps, if its monads
+    fall within the ranges of the candidate.
+
+    The results are packed into two arrays, for ``up`` and ``down``, see ``etcbc.layer``.
+    '''
     msg = API['msg']
     F = API['F']
     NN = API['NN']
-    lower_types = set(otypes)
-    for t in otypes:
-        msg("Objects contained in {}s".format(t), verbose='NORMAL')
-        lower_types.remove(t)
-        fill(NN, F, t, lower_types)
+    n_node = len(API['data_items']['zG00(node_sort)'])
+    rank = dict((t, r) for (r, t) in enumerate(otypes))
+    active = [collections.deque() for t in otypes]
+    up = [None for t in otypes]
+    down = [(array.array('I'), array.array('I')) for t in otypes]
+    msg("Objects contained in other objects", verbose='NORMAL')
+    for n in NN():
+        otype = F.db_otype.v(n)
+        r = rank.get(otype, None)
+        if r == None: continue
+        this_min = F.db_minmonad.i(n)
+        this_max = F.db_maxmonad.i(n)
+        this_monads = F.db_monads.v(n)
+        (containers, children) = down[r]
+        for er in range(r):
+            candidates = active[er]
+            while candidates and candidates[0][2] < this_min: candidates.popleft()
+            container = None
+            for (that_er, that_min, that_max, that_monads) in candidates:
+                if that_min > this_min or that_max < this_max: continue
+                if that_monads != None and not MonadSet.parse(this_monads) <= that_monads: continue
+                container = that_er
+                containers.append(that_er)
+                children.append(n)
+            if container != None:
+                if up[er] == None: up[er] = array.array('I', [0]) * n_node
+                up[er][n] = container + 1
+        active[r].append((n, this_min, this_max, MonadSet.parse(this_monads) if ',' in this_monads else None))
+    msg("Done", verbose='NORMAL')
+    return (layer_pack_up(n_node, up), layer_pack_down(n_node, down))
 
 def node_up(API):
-    if len(Lu) == 0: node_ud(API)
-    return Lu
+    down_handover.clear()
+    (up, down) = node_ud(API)
+    down_handover['down'] = (API['data_items']['zG00(node_sort)'], down)
+    return up
 
 def node_down(API):
-    if len(Ld) == 0: node_ud(API)
-    return Ld
+    (order, down) = down_handover.pop('down', (None, None))
+    if order is not API['data_items']['zG00(node_sort)']: down = node_ud(API)[1]
+    return down
 
 def verses(API):
-    API['fabric'].load_again({"features": ('db.otype sft.book sft.chapter sft.verse', '')}, add=True)
     msg = API['msg']
     F = API['F']
     NN = API['NN']
+    books = layer_up(API['data_items']['zL00(node_up)'])['book']
     verses = {}
     n = 0
     msg('Making verse index', verbose='NORMAL')
     for vn in F.db_otype.s('verse'):
         n += 1
-        bk = Lu['book'][vn]
+        bk = books[vn] - 1
         ch = int(F.sft_chapter.v(vn))
         vs = int(F.sft_verse.v(vn))
         verses.setdefault(bk, {}).setdefault(ch, {})[vs] = vn
     msg('Done. {} verses'.format(n), verbose='NORMAL')
     return verses
 
+passage_levels = (
+    ('book', 'sft.book'),
+    ('chapter', 'sft.chapter'),
+    ('verse', 'sft.verse'),
+    ('sentence', 'number'),
+    ('clause', 'number'),
+    ('phrase', 'number'),
+)
+
+def passages(API):
+    '''Index of passages.
+
+    ``numbered``: for each type in ``passage_levels`` and each value of its number feature,
+    the nodes of that type with that value in canonical order, and the canonical position of their first words.
+    ``chapters``: for each book node the chapter nodes by chapter number.
+    ``verse_order``: for each book node its verses in order, as tuples of chapter number, verse number and verse node.
+    '''
+    msg = API['msg']
+    F = API['F']
+    data_items = API['data_items']
+    node_sort_inv = data_items['zG00(node_sort_inv)']
+    books = layer_up(data_items['zL00(node_up)'])['book']
+    (offsets, words) = layer_down(data_items['zL00(node_down)'])['word']
+    msg('Making passage index', verbose='NORMAL')
+    numbered = {}
+    for (tp, fname) in passage_levels:
+        feat = F.item[fname.replace('.', '_')]
+        these = {}
+        for n in sorted(F.db_otype.s(tp), key=lambda n: node_sort_inv[n]):
+            if offsets[n] == offsets[n + 1]: continue
+            (starts, nodes) = these.setdefault(feat.v(n), (array.array('I'), array.array('I')))
+            starts.append(node_sort_inv[words[offsets[n]]])
+            nodes.append(n)
+        numbered[tp] = these
+    chapters = {}
+    for cn in F.db_otype.s('chapter'): chapters.setdefault(books[cn] - 1, {})[int(F.sft_chapter.v(cn))] = cn
+    verse_order = {}
+    for vn in F.db_otype.s('verse'):
+        verse_order.setdefault(books[vn] - 1, []).append((int(F.sft_chapter.v(vn)), int(F.sft_verse.v(vn)), vn))
+    for bn in verse_order: verse_order[bn] = tuple(sorted(verse_order[bn]))
+    msg('Done', verbose='NORMAL')
+    return dict(numbered=numbered, chapters=chapters, verse_order=verse_order)
+
 def books_la(API):
     msg = API['msg']
     F = API['F']
@@ -153,13 +164,17 @@ def prep_post(biblang='Hebrew', select=None):
         if select == None or 'T' in select: lafapi.api['T'] = Text(lafapi, biblang=biblang)
     return p
     
+monad_features = ('db.otype db.monads db.minmonad db.maxmonad', '')
+passage_features = ('db.otype sft.book sft.chapter sft.verse number', '')
+
 prepare_dict = collections.OrderedDict((
-    ('zG00(node_sort)', (node_order, __file__, True, 'etcbc')),
-    ('zG00(node_sort_inv)', (node_order_inv, __file__, True, 'etcbc')),
-    ('zL00(node_up)', (node_up, __file__, False, 'etcbc')),
-    ('zL00(node_down)', (node_down, __file__, False, 'etcbc')),
-    ('zV00(verses)', (verses, __file__, False, 'etcbc')),
-    ('zV00(books_la)', (books_la, __file__, False, 'etcbc')),
+    ('zG00(node_sort)', (node_order, __file__, True, 'etcbc', dict(features=monad_features))),
+    ('zG00(node_sort_inv)', (node_order_inv, __file__, True, 'etcbc', dict(depends=('zG00(node_sort)',)))),
+    ('zL00(node_up)', (node_up, __file__, False, 'etcbc', dict(features=monad_features, depends=('zG00(node_sort)',)))),
+    ('zL00(node_down)', (node_down, __file__, False, 'etcbc', dict(features=monad_features, depends=('zG00(node_sort)', 'zL00(node_up)')))),
+    ('zV00(verses)', (verses, __file__, False, 'etcbc', dict(features=passage_features, depends=('zL00(node_up)',)))),
+    ('zV00(books_la)', (books_la, __file__, False, 'etcbc', dict(features=passage_features, depends=('zG00(node_sort)',)))),
+    ('zV00(passages)', (passages, __file__, False, 'etcbc', dict(features=passage_features, depends=('zG00(node_sort_inv)', 'zL00(node_up)', 'zL00(node_down)')))),
 ))
 
 def prep(biblang='Hebrew', select=None):
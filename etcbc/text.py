@@ -1,3 +1,5 @@
+import re
+import bisect
 import collections
 
 from .lib import Transcription
@@ -5,6 +7,8 @@ from .blang import booklangs, booknames
 
 def h_esc(x): return x.replace('&', '&amp;').replace('<', '&lt;')
 
+passage_pat = re.compile(r'^\s*(.*?)(?:\s+([0-9]+)(?::([0-9]+))?(?:\s*-\s*(?:([0-9]+):)?([0-9]+))?)?\s*$')
+
 class Text(object):
     '''Text representations
     '''
@@ -26,54 +30,56 @@ class Text(object):
                 sft.book sft.chapter sft.verse
 ''', '')}, annox='', add=True, verbose='INFO')
         self._verses = lafapi.data_items['zV00(verses)']
+        self._chapters = lafapi.data_items['zV00(passages)']['chapters']
+        self._verse_order = lafapi.data_items['zV00(passages)']['verse_order']
         self.lafapi = lafapi
         self.env = lafapi.names.env
         F = lafapi.api['F']
         if biblang == 'Hebrew':
             self.transcription = Transcription()
 
-        def get_orig(w):
-            word = F.g_word_utf8.v(w)
+        def orig_source(w):
             qere = F.g_qere_utf8.v(w)
-            if qere == None:
-                orig = word
-                trl = F.trailer_utf8.v(w)
-            else:
-                orig = qere
-                trl = F.qtrailer_utf8.v(w)
-            origt = self.transcription.from_hebrew(orig + trl).replace('_', ' ')
-            return origt
+            return (F.g_word_utf8.v(w), F.trailer_utf8.v(w)) if qere == None else (qere, F.qtrailer_utf8.v(w))
+
+        def get_orig(key): return self.transcription.from_hebrew(key[0] + key[1]).replace('_', ' ')
 
-        def get_orig_p(w):
-            s = F.phono_sep.v(w)
+        def phono_source(w): return (F.phono.v(w), F.phono_sep.v(w))
+
+        def get_orig_p(key):
+            (phono, s) = key
             if '.' in s: s += '\n'
-            return F.phono.v(w)+s
+            return phono + s
 
-        def gp(w):
-            sep = F.unicodetrailer.v(w)
-            return '{}{}{}'.format(F.unicode.v(w), sep or ' ', '\n' if sep == '.' else '')
+        def gp(key):
+            (word, sep) = key
+            return '{}{}{}'.format(word, sep or ' ', '\n' if sep == '.' else '')
 
         if biblang == 'Hebrew':
-            self._transform = collections.OrderedDict((
-                ('hp', ('hebrew primary',             lambda w: F.g_word_utf8.v(w)+F.trailer_utf8.v(w))),
-                ('hpl', ('hebrew primary (lexeme)',   lambda w: F.g_lex_utf8.v(w)+' ')),
-                ('hcl', ('hebrew cons (lexeme)',      lambda w: F.lex_utf8.v(w).rstrip('/=[')+' ')),
-                ('ha', ('hebrew accent',              lambda w: Transcription.to_hebrew(get_orig(w)))),
-                ('hv', ('hebrew vowel',               lambda w: Transcription.to_hebrew_v(get_orig(w)))),
-                ('hc', ('hebrew cons',                lambda w: Transcription.to_hebrew_c(get_orig(w)))),
-                ('ep', ('trans primary',              lambda w: F.g_word.v(w))),
-                ('epl', ('trans primary (lexeme)',    lambda w: F.g_lex.v(w)+' ')),
-                ('ecl', ('hebrew cons (lexeme)',      lambda w: F.lex.v(w)+' ')),
-                ('ea', ('trans accent',               lambda w: get_orig(w))),
-                ('ev', ('trans vowel',                lambda w: Transcription.to_etcbc_v(get_orig(w)))),
-                ('ec', ('trans cons',                 lambda w: Transcription.to_etcbc_c(get_orig(w)))),
-                ('pf', ('phono full',                 lambda w: get_orig_p(w).replace('*',''))),
-                ('ps', ('phono simple',               lambda w: Transcription.ph_simplify(get_orig_p(w)))),
+            self._formats = collections.OrderedDict((
+                ('hp', ('hebrew primary',             lambda w: (F.g_word_utf8.v(w), F.trailer_utf8.v(w)),  lambda k: k[0]+k[1])),
+                ('hpl', ('hebrew primary (lexeme)',   lambda w: F.g_lex_utf8.v(w),                          lambda k: k+' ')),
+                ('hcl', ('hebrew cons (lexeme)',      lambda w: F.lex_utf8.v(w),                            lambda k: k.rstrip('/=[')+' ')),
+                ('ha', ('hebrew accent',              orig_source,                                          lambda k: Transcription.to_hebrew(get_orig(k)))),
+                ('hv', ('hebrew vowel',               orig_source,                                          lambda k: Transcription.to_hebrew_v(get_orig(k)))),
+                ('hc', ('hebrew cons',                orig_source,                                          lambda k: Transcription.to_hebrew_c(get_orig(k)))),
+                ('ep', ('trans primary',              lambda w: F.g_word.v(w),                              lambda k: k)),
+                ('epl', ('trans primary (lexeme)',    lambda w: F.g_lex.v(w),                               lambda k: k+' ')),
+                ('ecl', ('hebrew cons (lexeme)',      lambda w: F.lex.v(w),                                 lambda k: k+' ')),
+                ('ea', ('trans accent',               orig_source,                                          get_orig)),
+                ('ev', ('trans vowel',                orig_source,                                          lambda k: Transcription.to_etcbc_v(get_orig(k)))),
+                ('ec', ('trans cons',                 orig_source,                                          lambda k: Transcription.to_etcbc_c(get_orig(k)))),
+                ('pf', ('phono full',                 phono_source,                                         lambda k: get_orig_p(k).replace('*',''))),
+                ('ps', ('phono simple',               phono_source,                                         lambda k: Transcription.ph_simplify(get_orig_p(k)))),
             ))
         elif biblang == 'Greek':
-            self._transform = collections.OrderedDict((
-                ('gp', ('greek primary',              gp)),
+            self._formats = collections.OrderedDict((
+                ('gp', ('greek primary',              lambda w: (F.unicode.v(w), F.unicodetrailer.v(w)),    gp)),
             ))
+        self._transform = collections.OrderedDict(
+            (fmt, (desc, lambda w, fmt=fmt: self.words((w,), fmt=fmt))) for (fmt, (desc, source, render)) in self._formats.items()
+        )
+        self._rendered = {}
 
         self._books = lafapi.data_items['zV00(books_la)']
         self.book_nodes = tuple(x[0] for x in self._books)
@@ -90,10 +96,43 @@ class Text(object):
                 self._book_name.setdefault(ln, {})[bn] = book_ln
                 self._book_node.setdefault(ln, {})[book_ln] = bn
 
-    def node_of(self, book, chapter, verse, lang='en'):
+    def node_of(self, book, chapter, verse=None, lang='en'):
         book_node = self._book_node.get(lang, {}).get(book, None)
+        if verse == None: return self._chapters.get(book_node, {}).get(chapter, None)
         return self._verses.get(book_node, {}).get(chapter, {}).get(verse, None)
 
+    def verse_nodes(self, passage, lang='en'):
+        '''The verse nodes of a passage such as ``Genesis 1:1-2:3``, ``Gen 1:4-8``, ``Genesis 1-2:3``, ``Genesis 1-3``, ``Genesis 1`` or ``Genesis``.
+
+        The book may be abbreviated to a prefix of its name in ``lang`` that fits only one book.
+        '''
+        msg = self.lafapi.api['msg']
+        match = passage_pat.match(passage)
+        if not match:
+            msg('Cannot read passage "{}"'.format(passage))
+            return []
+        (book, ch1, vs1, ch2, vs2) = match.groups()
+        book_names = self._book_node.get(lang, {})
+        bn = book_names.get(book, None)
+        if bn == None:
+            candidates = [b for b in book_names if b.lower().startswith(book.lower())]
+            if len(candidates) != 1:
+                msg('{} book named "{}" in language "{}"'.format('More than one' if candidates else 'No', book, lang))
+                return []
+            bn = book_names[candidates[0]]
+        order = self._verse_order.get(bn, ())
+        if ch1 == None: return [x[2] for x in order]
+        ch1 = int(ch1)
+        if vs1 == None:
+            start = (ch1, 0)
+            end = (int(ch2), int(vs2) + 1) if ch2 != None else (int(vs2) + 1 if vs2 != None else ch1 + 1, 0)
+        else:
+            start = (ch1, int(vs1))
+            end = (int(ch2) if ch2 != None else ch1, int(vs2) + 1 if vs2 != None else int(vs1) + 1)
+        lo = bisect.bisect_left(order, start)
+        hi = bisect.bisect_left(order, end, lo)
+        return [x[2] for x in order[lo:hi]]
+
     def formats(self): return self._transform
 
     def book_name(self, bn, lang='en'): return self._book_name.get(lang, {}).get(bn, None)
@@ -120,38 +159,47 @@ class Text(object):
         vr = '' if first_word or vn == None or vn == vln else '-{}'.format(F.sft_verse.v(vln))
         return '{}{}{}{}'.format(bk, ch, vs, vr)
              
+    def reps(self, wnodes, fmt):
+        '''The representations of the words in ``wnodes`` in format ``fmt``.
+
+        They are computed once for every distinct combination of the feature values they are made of, and looked up per word.
+        '''
+        (desc, source, render) = self._formats[fmt]
+        by_source = self._rendered.setdefault(fmt, {})
+        result = []
+        for w in wnodes:
+            key = source(w)
+            rep = by_source.get(key)
+            if rep == None: rep = by_source[key] = render(key)
+            result.append(rep)
+        return result
+
     def words(self, wnodes, fmt=None):
         if fmt == None: fmt = 'ha' if self.biblang == 'Hebrew' else 'gp'
-        reps = []
-        fmt = fmt if fmt in self._transform else 'ha'
-        make_rep = self._transform[fmt][1]
-        for wnode in wnodes: reps.append(make_rep(wnode))
-        return ''.join(reps)
+        fmt = fmt if fmt in self._formats else 'ha'
+        return ''.join(self.reps(wnodes, fmt))
 
-    def text(self, book=None, chapter=None, verse=None, otype=None, fmt=None, html=False, verse_label=True, lang='en', style=None):
-        L = self.lafapi.api['L']
-        F = self.lafapi.api['F']
-        msg = self.lafapi.api['msg']
-        if fmt != None and otype != None:
-            otype = None
-            msg('fmt and otype parameters exclude each other. Ignoring otype="{}"'.format(otype)) 
-        if otype == None and fmt == None: fmt = 'ha' if self.biblang == 'Hebrew' else 'gp'
-        tables = []
-        txt = []
+    def _selection(self, book, chapter, verse):
         bks = [] if book == None else [book] if type(book) is str else list(book)
         chs = [] if chapter == None else [chapter] if type(chapter) is int else [int(chapter)] if type(chapter) is str else list(chapter)
         vss = [] if verse == None else [verse] if type(verse) is int else [int(verse)] if type(verse) is str else list(verse)
-        result_verse_nodes = []
+        return (bks, chs, vss)
 
-        def dump_table():
-            if not otype:
-                if html:
-                    tables.append('<table class="t">\n{}</table>\n\n'.format(''.join(txt)))
-                else:
-                    tables.append(''.join(txt))
-                txt.clear()
-            
-        if book == None: book_nodes = tuple(x[0] for x in self._books)
+    def _verse_groups(self, book, chapter, verse, lang, passage):
+        '''The selected verses as lists of ``(book name, chapter name, verse node)``, one list for each table of the text:
+        a list per chapter, or per book or for all verses if a single verse number is asked for. Empty lists are left out.
+        '''
+        L = self.lafapi.api['L']
+        F = self.lafapi.api['F']
+        msg = self.lafapi.api['msg']
+        (bks, chs, vss) = self._selection(book, chapter, verse)
+        group = []
+        if passage != None:
+            book_nodes = ()
+            group = [(self.book_name(L.u('book', vn), lang), F.sft_chapter.v(vn), vn) for vn in self.verse_nodes(passage, lang=lang)]
+            if group: yield group
+            group = []
+        elif book == None: book_nodes = tuple(x[0] for x in self._books)
         else:
             book_nodes = []
             for bk in bks:
@@ -167,10 +215,11 @@ class Text(object):
             else:
                 chapter_nodes = []
                 for ch in chs:
-                    if ch not in self._verses[bn]:
+                    cn = self._chapters.get(bn, {}).get(ch, None)
+                    if cn == None:
                         msg('No chapter {} in book "{}" ({})'.format(ch, bkname, lang))
                     else:
-                        chapter_nodes.extend([c for c in cnodes if int(F.sft_chapter.v(c)) == ch])
+                        chapter_nodes.append(cn)
             for cn in chapter_nodes:
                 chname = F.sft_chapter.v(cn)
                 vnodes = L.d('verse', cn)
@@ -178,28 +227,31 @@ class Text(object):
                 else: 
                     verse_nodes = []
                     for vs in vss:
-                        if vs not in self._verses[bn][int(chname)]:
+                        vn = self._verses[bn][int(chname)].get(vs, None)
+                        if vn == None:
                             msg('No verse {} in book "{}" ({}) chapter {}'.format(vs, bkname, lang, chname))
                         else:
-                            verse_nodes.extend([v for v in vnodes if int(F.sft_verse.v(v)) == vs])
-                if otype:
-                    result_verse_nodes.extend(verse_nodes)
-                if fmt:
-                    for vn in verse_nodes:
-                        vsname = F.sft_verse.v(vn)
-                        vslabel = '{} {}:{}'.format(bkname,chname,vsname)
-                        vshead = '' if not verse_label else '<td class="vl">{}</td>'.format(vslabel) if html else '{}\t'.format(vslabel)
-                        tx = self.words(L.d('word', vn), fmt=fmt)
-                        if html: tx = '<td class="{}">{}</td>'.format(fmt[0], h_esc(tx))
-                        line = '<tr>{}{}</tr>\n'.format(vshead, tx) if html else vshead + tx.rstrip('\n')+'\n'
-                        txt.append(line)
+                            verse_nodes.append(vn)
+                group.extend((bkname, chname, vn) for vn in verse_nodes)
+                if len(vss) != 1 and group:
+                    yield group
+                    group = []
+            if len(vss) == 1 and len(chs) != 1 and group:
+                yield group
+                group = []
+        if group: yield group
 
-                if len(vss) != 1: dump_table()
-            if len(vss) == 1 and len(chs) != 1: dump_table()
-        if len(vss) == 1 and len(chs) == 1: dump_table()
+    def text(self, book=None, chapter=None, verse=None, otype=None, fmt=None, html=False, verse_label=True, lang='en', style=None, passage=None):
+        L = self.lafapi.api['L']
+        msg = self.lafapi.api['msg']
+        if fmt != None and otype != None:
+            otype = None
+            msg('fmt and otype parameters exclude each other. Ignoring otype="{}"'.format(otype)) 
+        if otype == None and fmt == None: fmt = 'ha' if self.biblang == 'Hebrew' else 'gp'
         if otype:
             result_words = []
-            for vn in result_verse_nodes: result_words.extend(L.d('word', vn))
+            for group in self._verse_groups(book, chapter, verse, lang, passage):
+                for (bkname, chname, vn) in group: result_words.extend(L.d('word', vn))
             if otype == 'word': return result_words
             else:
                 result_objects = []
@@ -210,28 +262,53 @@ class Text(object):
                         result_objects.append(obj)
                         objects_seen.add(obj)
                 return result_objects
-        if fmt:
-            body = ''.join(tables)
-            if not style or not html:
-                return body
-            else:
-                title = '{} {}:{} [{}]'.format(
-                    ', '.join(str(bk) for bk in bks) if book != None else 'all books',
-                    ', '.join(str(ch) for ch in chs) if chapter != None else 'all chapters',
-                    ', '.join(str(vs) for vs in vss) if verse != None else 'all verses',
-                    fmt,
-                )
-                return '''<html>
+        return ''.join(self.text_iter(book=book, chapter=chapter, verse=verse, fmt=fmt, html=html, verse_label=verse_label, lang=lang, style=style, passage=passage))
+
+    def text_iter(self, book=None, chapter=None, verse=None, fmt=None, html=False, verse_label=True, lang='en', style=None, passage=None):
+        '''The text that ``text()`` gives in format ``fmt``, as a sequence of strings that are made one by one:
+        a table per chapter, preceded and followed by the head and tail of the html document if there is a style.
+        '''
+        L = self.lafapi.api['L']
+        F = self.lafapi.api['F']
+        if fmt == None: fmt = 'ha' if self.biblang == 'Hebrew' else 'gp'
+
+        def verse_line(bkname, chname, vn):
+            vsname = F.sft_verse.v(vn)
+            vslabel = '{} {}:{}'.format(bkname,chname,vsname)
+            vshead = '' if not verse_label else '<td class="vl">{}</td>'.format(vslabel) if html else '{}\t'.format(vslabel)
+            tx = self.words(L.d('word', vn), fmt=fmt)
+            if html: tx = '<td class="{}">{}</td>'.format(fmt[0], h_esc(tx))
+            return '<tr>{}{}</tr>\n'.format(vshead, tx) if html else vshead + tx.rstrip('\n')+'\n'
+
+        document = style and html
+        if document:
+            (bks, chs, vss) = self._selection(book, chapter, verse)
+            title = '{} [{}]'.format(passage, fmt) if passage != None else '{} {}:{} [{}]'.format(
+                ', '.join(str(bk) for bk in bks) if book != None else 'all books',
+                ', '.join(str(ch) for ch in chs) if chapter != None else 'all chapters',
+                ', '.join(str(vs) for vs in vss) if verse != None else 'all verses',
+                fmt,
+            )
+            yield '''<html>
 <head>
 <meta http-equiv="Content-Type" content="text/html; charset=UTF-8" />
 <title>{}</title>
 {}
 </head>
 <body>
-{}
+'''.format(title, style)
+        for group in self._verse_groups(book, chapter, verse, lang, passage):
+            lines = ''.join(verse_line(bkname, chname, vn) for (bkname, chname, vn) in group)
+            yield '<table class="t">\n{}</table>\n\n'.format(lines) if html else lines
+        if document: yield '''
 </body>
 </html>
-'''.format(title, style, body)
+'''
+
+    def write(self, handle, book=None, chapter=None, verse=None, fmt=None, html=False, verse_label=True, lang='en', style=None, passage=None):
+        '''Writes the text of ``text_iter()`` to the open file ``handle`` as it is made.'''
+        for chunk in self.text_iter(book=book, chapter=chapter, verse=verse, fmt=fmt, html=html, verse_label=verse_label, lang=lang, style=style, passage=passage):
+            handle.write(chunk)
 
     def style(self, params=None, show_params=False):
         msg = self.lafapi.api['msg']
@@ -1,7 +1,6 @@
 import collections
 import copy
-import functools
-from .lib import monad_set, object_rank
+from .lib import MonadSet, object_rank
 
 class Tree(object):
     def __init__(self, API, otypes=None, clause_type=None, phrase_type=None,
@@ -51,9 +50,9 @@ class Tree(object):
             if cn == chunk:
                 msg("{} nodes".format(nn))
                 cn = 0
-            nm_set = monad_set(Fmonadsv(node))
-            nm_min = min(nm_set)
-            nm_max = max(nm_set)
+            nm_set = MonadSet.parse(Fmonadsv(node))
+            nm_min = nm_set.min()
+            nm_max = nm_set.max()
             ls = len(cur_stack)
             tobe_removed = set()
             for si in range(ls):
@@ -222,7 +221,7 @@ class Tree(object):
         ids = {}
         maxid = 0
         ccrf = F.item[self.ccr_feature].v
-        bmonad = int(F.db_minmonad.v(node))
+        bmonad = F.db_minmonad.i(node)
         Fotypev = F.db_otype.v
         Fmonadsv = F.db_monads.v
         elder_sister = self.elder_sister
@@ -319,7 +318,7 @@ class Tree(object):
         otype = F.db_otype.v(node)
         children = self.rchildren if kind == 'r' else self.echildren 
         sisters = self.sisters if kind == 'r' else {}
-        bmonad = int(F.db_minmonad.v(node))
+        bmonad = F.db_minmonad.i(node)
 
         words = []
         sequential = []
@@ -385,7 +384,7 @@ class Tree(object):
             elif kind == 'r': return max(cdepth + 1, sdepth) if has_sisters else cdepth
         return _depth(node, kind)
 
-    def length(self, node): return len(monad_set(self.API['F'].monads.v(node)))
+    def length(self, node): return len(MonadSet.parse(self.API['F'].monads.v(node)))
 
     def get_leaves(self, node, kind):
         API = self.API
@@ -422,7 +421,7 @@ class Tree(object):
         API = self.API
         F = API['F']
         Fmonadsv = F.db_monads.v
-        return functools.reduce(lambda x,y: x | y, (monad_set(Fmonadsv(leaf)) for leaf in self.get_leaves(node, kind)), set())
+        return MonadSet.union(*(MonadSet.parse(Fmonadsv(leaf)) for leaf in self.get_leaves(node, kind)))
         #return set(int(F.db_monads.v(n)) for n in self.get_leaves(node, kind))
 
     def get_root(self, node, kind):
@@ -0,0 +1,65 @@
+'''Bulk operations on compiled arrays.
+
+If NumPy can be imported, these operations work on ``ndarray`` views of the arrays, without copying them.
+Otherwise, or after ``use_numpy(False)``, they run in plain Python. Both give the same results.
+'''
+import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+active = numpy != None
+
+def use_numpy(on=True):
+    '''Switch the NumPy backend on or off. Returns whether it is on: it cannot be switched on without NumPy.'''
+    global active
+    active = on and numpy != None
+    return active
+
+def view(data):
+    '''The array ``data`` as an ``ndarray`` that shares its memory; ``data`` itself without NumPy.'''
+    if numpy == None: return data
+    return numpy.frombuffer(data, dtype=data.typecode) if len(data) else numpy.zeros(0, dtype=data.typecode)
+
+def to_array(values, code):
+    '''An ``array`` with typecode ``code`` of the items of an ``ndarray``.'''
+    result = array.array(code)
+    result.frombytes(values.astype(code).tobytes())
+    return result
+
+def sort_by_interval(nodes, node_anchor_min, node_anchor_max):
+    '''The nodes sorted by their minimal anchor, and then by their maximal anchor in reverse. The sort is stable.'''
+    if not active:
+        return array.array('I', sorted(nodes, key=lambda n: (node_anchor_min[n], -node_anchor_max[n])))
+    ns = view(nodes)
+    amin = view(node_anchor_min)[ns].astype('q')
+    amax = view(node_anchor_max)[ns].astype('q')
+    return to_array(ns[numpy.lexsort((-amax, amin))], 'I')
+
+MARK_FRACTION = 64
+
+def canonical(nodes, node_sort, node_sort_inv):
+    '''The distinct ``nodes`` in the order of ``node_sort``, which has rank map ``node_sort_inv``.
+
+    With NumPy, sets of at least ``1/MARK_FRACTION`` of all nodes are marked in a boolean array and picked from ``node_sort`` in one go,
+    instead of sorting them. That takes a pass over all nodes, so smaller sets are sorted by rank.
+    '''
+    if active and len(nodes) and len(node_sort) and len(nodes) * MARK_FRACTION >= len(node_sort):
+        ns = numpy.fromiter(nodes, dtype='q', count=len(nodes))
+        order = view(node_sort)
+        marked = numpy.zeros(max(int(ns.max()), int(order.max())) + 1, dtype=bool)
+        marked[ns] = True
+        result = order[marked[order]]
+        if len(result) == len(nodes): return result.tolist()
+    return sorted(nodes, key=node_sort_inv.__getitem__)
+
+def sort_by_value(column, missing):
+    '''The positions in ``column`` that do not hold ``missing``, sorted by value and then by position, and their values.'''
+    if not active:
+        nodes = array.array('I', sorted((n for n in range(len(column)) if column[n] != missing), key=lambda n: (column[n], n)))
+        return (nodes, array.array('q', (column[n] for n in nodes)))
+    values = view(column)
+    ns = numpy.nonzero(values != missing)[0]
+    ns = ns[numpy.argsort(values[ns], kind='stable')]
+    return (to_array(ns, 'I'), to_array(values[ns], 'q'))
@@ -5,12 +5,62 @@ import array
 import pickle
 import collections
 import gzip
+import mmap
 from .names import Names, FabricError
 from .parse import parse
 from .model import model
+from .lib import narrow_array
 
 GZIP_LEVEL = 2
 PICKLE_PROTOCOL = 3
+ARRAY_MAGIC = b'LAFarr' # array files start with this, followed by the typecode and a newline
+
+class MappedText(object):
+    '''Text in a UTF-8 file that is mapped into memory, not read. Slicing gives strings, as with ``str``.
+
+    ``index`` holds the byte position of every ``BLOCK``-th character, so a slice decodes only the blocks it touches.
+    ``MappedText.open(path, cache_dir)`` maps the text of the gzipped text file ``path``.
+    Its uncompressed form and the index are written to ``cache_dir`` when missing or older, in a single pass over the text.
+    They are written to temporary files first and then moved into place, so a text that is still mapped is never overwritten.
+    '''
+    BLOCK = 64
+
+    def __init__(self, tpath, index, length):
+        self.index = index
+        self.length = length
+        with open(tpath, 'rb') as f: self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if index[-1] else b''
+
+    @classmethod
+    def open(cls, path, cache_dir):
+        base = '{}/{}'.format(cache_dir, os.path.basename(path))
+        (tpath, ipath) = (base + '.utf8', base + '.utf8idx')
+        if not all(os.path.exists(p) and os.path.getmtime(p) >= os.path.getmtime(path) for p in (tpath, ipath)):
+            if not os.path.exists(cache_dir): os.makedirs(cache_dir)
+            index = array.array('Q', [0, 0])
+            with gzip.open(path, "rt", encoding="utf-8") as f, open(tpath + '.tmp', 'wb') as t:
+                while True:
+                    chunk = f.read(cls.BLOCK)
+                    if not chunk: break
+                    index[0] += len(chunk)
+                    index.append(index[-1] + t.write(chunk.encode('utf-8')))
+            with open(ipath + '.tmp', 'wb') as f: index.tofile(f)
+            os.replace(tpath + '.tmp', tpath)
+            os.replace(ipath + '.tmp', ipath)
+        index = array.array('Q')
+        with open(ipath, 'rb') as f: index.frombytes(f.read())
+        return cls(tpath, index[1:], index[0])
+
+    def __len__(self): return self.length
+    def __str__(self): return self[:]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice): return self[key:key + 1 or None] if -self.length <= key < self.length else ''[key]
+        (start, stop, step) = key.indices(self.length)
+        if step != 1: return self[start:stop][::step] if step > 0 else str(self)[key]
+        if start >= stop: return ''
+        block = self.BLOCK
+        (b, e) = (start // block, (stop - 1) // block + 1)
+        return self.data[self.index[b]:self.index[e]].decode('utf-8')[start - b * block:stop - b * block]
 
 class LafData(object):
     '''Manage the compiling and loading of LAF/GraF data.'''
@@ -19,6 +69,7 @@ class LafData(object):
         self.log = None
         self.clog = None
         self.data_items = {}
+        self.primary_mmap = False
 
     def prepare_dirs(self, annox):
         env = self.names.env
@@ -174,6 +225,10 @@ class LafData(object):
                 self.stamp.Dmsg("load {}".format(Names.dmsg(dkey))) 
                 ism = self.names.dinfo(dkey)[0]
                 self._load_file(dkey, accept_missing=not ism)
+        pkey = Names.comp('mP00', ('primary_data',))
+        if pkey in self.data_items and isinstance(self.data_items[pkey], MappedText) != self.primary_mmap:
+            self.stamp.Dmsg("load {} {}".format(Names.dmsg(pkey), 'mapped' if self.primary_mmap else 'in memory'))
+            self._load_file(pkey)
 
     def _load_extra(self, dkeys):
         for dkey in dkeys:
@@ -194,10 +249,49 @@ class LafData(object):
             if dkey in dkeys['prep']:
                 self.stamp.Dmsg("clear {}".format(Names.dmsg(dkey))) 
                 self._clear_file(dkey)
-        for dkey in dkeys['load']:
-            if dkey in dkeys['prep']:
-                self.stamp.Nmsg("prep {}".format(Names.dmsg(dkey))) 
-                self._load_file(dkey, accept_missing=False)
+        for dkey in self._prep_order([dkey for dkey in dkeys['load'] if dkey in dkeys['prep']]):
+            self.stamp.Nmsg("prep {}".format(Names.dmsg(dkey))) 
+            self._load_file(dkey, accept_missing=False)
+
+    def _prep_decl(self, dkey):
+        '''The declaration of a prepared data item: its input features and the prepared data items it depends on.'''
+        spec = self.prepare_dict[dkey]
+        return spec[4] if len(spec) > 4 else {}
+
+    def _prep_order(self, dkeys):
+        '''Order prepared data items such that each item comes after the items it depends on.'''
+        order = []
+        def visit(dkey, path):
+            if dkey in order: return
+            if dkey in path:
+                raise FabricError("Circular dependency between prepared data: {}".format(' -> '.join(Names.dmsg(d) for d in path + [dkey])), self.stamp)
+            for dep in self._prep_decl(dkey).get('depends', ()):
+                if dep in dkeys: visit(dep, path + [dkey])
+            order.append(dkey)
+        for dkey in dkeys: visit(dkey, [])
+        return order
+
+    def _prep_inputs(self, dkey):
+        '''The files that a prepared data item is computed from: the compiled data of its declared input features
+        in the main source and the annoxes, and the files of the prepared data items it depends on.
+        '''
+        env = self.names.env
+        decl = self._prep_decl(dkey)
+        inputs = []
+        features = decl.get('features', ('', ''))
+        for (kind, index) in (('node', 0), ('edge', 1)):
+            for fname in features[index].split():
+                feature = self.api['fabric'].resolve_feature(kind, fname)
+                fkeys = [Names.comp('mF{}0'.format(kind[0]), feature)] + [Names.comp('a{}:F{}0'.format(anx, kind[0]), feature) for anx in env['annox']]
+                for fkey in fkeys:
+                    (ism, dloc, dfile, dtype, dprep) = self.names.dinfo(fkey)
+                    fpath = "{}/{}".format(dloc, dfile)
+                    if os.path.exists(fpath): inputs.append(fpath)
+        for dep in decl.get('depends', ()):
+            (ism, dloc, dfile, dtype, dprep) = self.names.dinfo(dep)
+            if dprep: dloc = self.names.z_compiled_dir(self.prepare_dict[dep][3])
+            inputs.append("{}/{}".format(dloc, dfile))
+        return inputs
 
     def _load_file(self, dkey, accept_missing=False):
         env = self.names.env
@@ -206,16 +300,18 @@ class LafData(object):
             if dkey not in self.prepare_dict:
                 raise FabricError("Cannot prepare data for {}. No preparation method available.".format(Names.dmsg(dkey)), self.stamp)
                 return
-            self.names.setenv(zspace=self.prepare_dict[dkey][-1])
+            self.names.setenv(zspace=self.prepare_dict[dkey][3])
         (ism, dloc, dfile, dtype, dprep) = self.names.dinfo(dkey)
         dpath = "{}/{}".format(dloc, dfile)
         prep_done = False
         if dprep:
-            (method, method_source, replace, zspace) = self.prepare_dict[dkey] 
+            (method, method_source, replace, zspace) = self.prepare_dict[dkey][0:4]
+            decl = self._prep_decl(dkey)
+            inputs = [method_source] + (self._prep_inputs(dkey) if decl else [env['m_compiled_path']])
             up_to_date = os.path.exists(dpath) and \
-                os.path.getmtime(dpath) >= os.path.getmtime(method_source) and \
-                os.path.getmtime(dpath) >= os.path.getmtime(env['m_compiled_path']) 
+                all(os.path.getmtime(dpath) >= os.path.getmtime(ipath) for ipath in inputs)
             if not up_to_date:
+                if 'features' in decl: self.api['fabric'].load_again({"features": decl['features']}, add=True)
                 self.stamp.Nmsg("PREPARING {}".format(Names.dmsg(dkey)))
                 compiled_dir = self.names.env['{}_compiled_dir'.format('z')]
                 try:
@@ -234,13 +330,23 @@ class LafData(object):
         if not prep_done:
             newdata = None
             if dtype == 'arr':
-                newdata = array.array('I')
                 with gzip.open(dpath, "rb") as f: contents = f.read()
+                code = 'I'
+                if contents.startswith(ARRAY_MAGIC):
+                    m = len(ARRAY_MAGIC)
+                    code = contents[m:m + 1].decode('ascii')
+                    contents = contents[m + 2:]
+                newdata = array.array(code)
                 newdata.frombytes(contents)
             elif dtype == 'dct':
                 with gzip.open(dpath, "rb") as f: newdata = pickle.load(f)
             elif dtype == 'str':
-                with gzip.open(dpath, "rt", encoding="utf-8") as f: newdata = f.read(None)
+                if self.primary_mmap:
+                    try: newdata = MappedText.open(dpath, self.names.env['mmap_dir'])
+                    except os.error as e:
+                        raise FabricError("could not map primary data {}".format(dpath), self.stamp, cause=e)
+                else:
+                    with gzip.open(dpath, "rt", encoding="utf-8") as f: newdata = f.read(None)
             self.data_items[dkey] = newdata
         if dprep:
             if replace:
@@ -270,7 +376,11 @@ class LafData(object):
         thedata = self.data_items[dkey]
         self.stamp.Dmsg("write {}".format(Names.dmsg(dkey))) 
         if dtype == 'arr':
-            with gzip.open(dpath, "wb", compresslevel=GZIP_LEVEL) as f: thedata.tofile(f)
+            thedata = narrow_array(thedata)
+            self.data_items[dkey] = thedata
+            with gzip.open(dpath, "wb", compresslevel=GZIP_LEVEL) as f:
+                f.write(ARRAY_MAGIC + thedata.typecode.encode('ascii') + b'\n')
+                thedata.tofile(f)
         elif dtype == 'dct':
             with gzip.open(dpath, "wb", compresslevel=GZIP_LEVEL) as f: pickle.dump(thedata, f, protocol=PICKLE_PROTOCOL)
         elif dtype == 'str':
@@ -1,16 +1,166 @@
-from .lib import grouper
-from .names import Names
+import array
+import bisect
+import collections
+import re
+from .lib import grouper, bisect_by, array_code, regex_prefix, sort_adjacency, is_sorted_adjacency, merge_adjacency
+from .names import Names, FabricError
+from .model import containment
+from . import backend
+
+def overlay(main, layers, nested=False, order=None):
+    '''Merge annox layers over the main data into a single read-only table.
+
+    Later layers override earlier ones, and all layers override the main data.
+    Without layers the main table itself is used, so nothing is copied.
+    With ``nested=True`` (connectivity) only the adjacency of nodes that are touched by an annox is copied.
+    If ``order`` is given, the merged adjacencies are sorted by that rank map.
+    '''
+    if not layers: return main
+    merged = dict(main)
+    for layer in layers:
+        if nested:
+            for (n, adj) in layer.items():
+                if order != None and n in merged: merged[n] = merge_adjacency(merged[n], adj, order)
+                else:
+                    nadj = dict(merged.get(n, {}))
+                    nadj.update(adj)
+                    merged[n] = nadj
+        else: merged.update(layer)
+    return merged
+
+def sorted_connectivity(data, order):
+    '''The connectivity table ``data`` with the adjacency of each node in the order of the rank map ``order``.
+
+    Adjacencies that are in that order already, as the compiler stores them, are shared; the others are sorted into copies.
+    ``data`` itself is never changed, and it is returned as is if nothing needs sorting.
+    '''
+    result = None
+    for (n, adj) in data.items():
+        if len(adj) > 1 and not is_sorted_adjacency(adj, order):
+            if result == None: result = dict(data)
+            result[n] = sort_adjacency(adj, order)
+    return data if result == None else result
+
+INT_MISSING = -(1 << 63)
+
+def int_column(data):
+    '''The values of a feature as an array of ints indexed by node or edge, with ``INT_MISSING`` for absent values.
+
+    Returns ``None`` if there is a value that is not the plain string representation of an integer.
+    '''
+    column = array.array('q', [INT_MISSING]) * (max(data) + 1 if data else 0)
+    try:
+        for (ne, x) in data.items():
+            i = int(x)
+            if str(i) != x or i == INT_MISSING: return None
+            column[ne] = i
+    except (ValueError, TypeError, OverflowError): return None
+    return column
+
+def adjacency(data, value=None):
+    '''The adjacency of a connectivity table as two arrays: ``offsets`` and ``targets``.
+
+    The neighbours of node ``n`` are ``targets[offsets[n]:offsets[n+1]]``.
+    If ``value`` is given, only edges with that value count.
+    '''
+    n_node = max(data) + 1 if data else 0
+    targets = []
+    offsets = [0]
+    for n in range(n_node):
+        adj = data.get(n)
+        if adj: targets.extend(m for (m, v) in adj.items() if value == None or v == value)
+        offsets.append(len(targets))
+    return (array.array(array_code(len(targets)), offsets), array.array(array_code(max(targets) if targets else 0), targets))
+
+def reachable_sinks(starts, offsets, targets, known):
+    '''For the nodes reachable from ``starts``: the set of reachable nodes without outgoing edges.
+
+    Nodes in ``known`` (a mapping to such sets) are not walked again.
+    The result is a dict with a frozenset for every node that has been walked.
+    The walk is an iterative depth-first search that collapses cycles (Tarjan), so every node is handled once.
+    '''
+    result = {}
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    n_off = len(offsets) - 1
+    def nexts(n): return targets[offsets[n]:offsets[n + 1]] if n < n_off else ()
+    def enter(n):
+        index[n] = low[n] = len(index)
+        stack.append(n)
+        on_stack.add(n)
+        work.append((n, iter(nexts(n))))
+    for s in starts:
+        if s in index or s in known: continue
+        work = []
+        enter(s)
+        while work:
+            (n, todo) = work[-1]
+            deeper = False
+            for m in todo:
+                if m in known: continue
+                if m not in index:
+                    enter(m)
+                    deeper = True
+                    break
+                if m in on_stack: low[n] = min(low[n], index[m])
+            if deeper: continue
+            work.pop()
+            if work: low[work[-1][0]] = min(low[work[-1][0]], low[n])
+            if low[n] != index[n]: continue
+            component = set()
+            while True:
+                m = stack.pop()
+                on_stack.discard(m)
+                component.add(m)
+                if m == n: break
+            sinks = set()
+            for m in component:
+                ms = nexts(m)
+                if not len(ms): sinks.add(m)
+                for x in ms:
+                    if x in component: continue
+                    sinks |= known[x] if x in known else result[x]
+            sinks = frozenset(sinks)
+            for m in component: result[m] = sinks
+    return result
+
+def value_index(data):
+    '''The nodes/edges per value of a feature: a dict from each value to an array of the nodes/edges that have it, in increasing order.
+
+    Under ``None`` are all nodes/edges that have a value.
+    '''
+    nes = sorted(data)
+    code = array_code(nes[-1] if nes else 0)
+    per_value = collections.defaultdict(lambda: array.array(code))
+    for ne in nes: per_value[data[ne]].append(ne)
+    result = dict(per_value)
+    result[None] = array.array(code, nes)
+    return result
+
+def same_layers(reuse, layers):
+    '''Whether ``reuse`` has been built from exactly the same data tables as the ones in ``layers``.'''
+    return reuse != None and len(reuse.layers) == len(layers) and all(a is b for (a, b) in zip(reuse.layers, layers))
 
 class Feature(object):
     '''Feature data and lookup.
 
     Holds the mapping from nodes/edges to values corresponding to a single feature.
-    Has distinct mappings for main source data and annox data.
+    The main source data and the annox data are merged into one table once per load,
+    the main source data remains available separately.
+    If a later load has the same data for this feature, the merged table is reused.
 
     ``v(node_or_edge)`` is the lookup method.
-    ``s(value=None)`` yields the nodes/edges that have this value or any value.
+    ``V(node_or_edge)`` looks up in the main source data only.
+    ``s(value=None)`` yields the nodes that have this value or any value, in the canonical order;
+    for edge features it gives an array of the edges, in increasing order.
+    It is served from an index from values to nodes/edges, made when first used.
+    ``i(node_or_edge)`` is the lookup method for features whose values are all integers, it delivers ints.
+    ``r(low, high)`` yields the nodes/edges whose integer value is between ``low`` and ``high``.
+    The integer column and its sorted index are made when first used.
     '''
-    def __init__(self, lafapi, feature, kind):
+    def __init__(self, lafapi, feature, kind, reuse=None):
         env = lafapi.names.env
         self.source = lafapi
         self.kind = kind
@@ -18,98 +168,166 @@ class Feature(object):
         label = Names.comp('mF' + kind + '0', feature)
         alabels = [Names.comp('a{}:F{}0'.format(anx, kind), feature) for anx in env['annox']] 
         self.lookup = data_items[label] if label in data_items else {}
-        self.alookup = {}
-        for alabel in alabels:
-            if alabel in data_items: self.alookup.update(data_items[alabel])
+        alayers = tuple(data_items[alabel] for alabel in alabels if alabel in data_items)
+        self.layers = (data_items.get(label),) + alayers
+        self.feature = feature
+        if same_layers(reuse, self.layers):
+            self.data = reuse.data
+            self._ints = reuse._ints
+            self._int_index = reuse._int_index
+            self._postings = reuse._postings
+        else:
+            self.data = overlay(self.lookup, alayers)
+            self._ints = None
+            self._int_index = None
+            self._postings = None
+        self._alookup = None
+
+    @property
+    def alookup(self):
+        if self._alookup == None: self._alookup = overlay({}, self.layers[1:])
+        return self._alookup
 
-    def v(self, ne): return self.alookup.get(ne, self.lookup.get(ne))
+    def v(self, ne): return self.data.get(ne)
     def V(self, ne): return self.lookup.get(ne)
 
+    def _int_column(self):
+        if self._ints == None:
+            self._ints = int_column(self.data)
+            if self._ints == None:
+                raise FabricError("Feature {} has values that are not integers".format('.'.join(self.feature)), self.source.stamp)
+        return self._ints
+
+    def i(self, ne):
+        ints = self._int_column()
+        x = ints[ne] if ne < len(ints) else INT_MISSING
+        return None if x == INT_MISSING else x
+
+    def r(self, low=None, high=None):
+        if self._int_index == None: self._int_index = backend.sort_by_value(self._int_column(), INT_MISSING)
+        (nodes, values) = self._int_index
+        lo = 0 if low == None else bisect.bisect_left(values, low)
+        hi = len(values) if high == None else bisect.bisect_right(values, high)
+        for ne in nodes[lo:hi]: yield ne
+
+    def postings(self, value=None):
+        '''The nodes/edges with ``value``, or with any value, as an array in increasing order.'''
+        if self._postings == None: self._postings = value_index(self.data)
+        return self._postings.get(value, array.array('B'))
+
     def s(self, value=None):
+        nes = self.postings(value)
+        if self.kind == 'e': return nes[:]
         data_items = self.source.data_items
-        order = data_items[Names.comp('mG00', ('node_sort_inv',))]
-        domain = sorted(set(self.lookup) | set(self.alookup), key=lambda x:order[x])
-        if value == None:
-            for n in domain: yield n
-        else:
-            for n in domain:
-                if self.alookup.get(n, self.lookup.get(n)) == value: yield n
+        return iter(backend.canonical(nes, data_items[Names.comp('mG00', ('node_sort',))], data_items[Names.comp('mG00', ('node_sort_inv',))]))
 
 class Connection(object):
     '''Connection info according to an edge feature.
 
     Holds the mapping from nodes to a set of ``(node, value)`` pairs for which there is
     an edge for which this edge feature has ``value``.
-    Has distinct mappings for main source data and annox data.
+    The main source data and the annox data are merged into one table once per load.
 
     ``v(node)`` yields the nodes (without the values).
     ``vv(node)`` yields the node/value pairs.
+    With ``sort=True`` they come in the canonical node order. The compiler stores them in that order;
+    if the order has been replaced by prepared data, a sorted table is made once, on first use.
     ``endnodes(nodeset, value=None) yields the set of end nodes after traveling from ``nodeset`` along edges
     (having this feature with this value or any value).
+    ``pairs(value=None)`` gives the edges with this value, or with any value, as two arrays: their start nodes and their end nodes
+    (for ``Ci`` the other way round). They are in the order of the edges, found by the index of the edge feature;
+    for the special features ``laf__x`` and ``laf__y`` they are ordered by node.
+    ``endnodes_many(nodes, value=None)`` gives the end nodes for each of the ``nodes`` separately, in one pass.
+    The traversal works on an array form of the adjacency, made per value when first needed: ``arrays(value=None)``
+    gives it as ``(offsets, targets)``, the neighbours of ``n`` are ``targets[offsets[n]:offsets[n+1]]``.
+    The end nodes per start node are remembered, the least recently used ones are forgotten after ``memo_size`` entries.
     '''
-    def __init__(self, lafapi, feature, inv):
+    memo_size = 1 << 16
+
+    def __init__(self, lafapi, feature, inv, reuse=None):
         env = lafapi.names.env
         self.lafapi = lafapi
         self.inv = inv
+        self.feature = feature
         data_items = lafapi.data_items
         label = Names.comp('mC0' + inv, feature)
         alabels = [Names.comp('a{}:C0{}'.format(anx, inv), feature) for anx in env['annox']] 
         self.lookup = data_items[label] if label in data_items else {}
-        self.alookup = {}
-        for alabel in alabels:
-            if alabel in data_items: self.alookup.update(data_items[alabel])
+        alayers = tuple(data_items[alabel] for alabel in alabels if alabel in data_items)
+        self.layers = (data_items.get(label),) + alayers
+        if same_layers(reuse, self.layers):
+            self.data = reuse.data
+            self._adjacency = reuse._adjacency
+            self._memo = reuse._memo
+            self._sorted = reuse._sorted
+        else:
+            self.data = overlay(self.lookup, alayers, nested=True, order=data_items.get(Names.comp('mG00', ('node_sort_inv',))))
+            self._adjacency = {}
+            self._memo = {}
+            self._sorted = None
+
+    def _sorted_data(self):
+        order = self.lafapi.data_items[Names.comp('mG00', ('node_sort_inv',))]
+        if self._sorted == None or self._sorted[0] is not order: self._sorted = (order, sorted_connectivity(self.data, order))
+        return self._sorted[1]
 
-    def e(self, n): return len(self.lookup.get(n, {})) or len(self.alookup.get(n, {}))
+    def e(self, n): return len(self.data.get(n, {}))
 
     def v(self, n, sort=False):
-        lookup = self.lookup
-        alookup = self.alookup
-        if sort:
-            cn = lookup.get(n, {})
-            cn.update(alookup.get(n, {}))
-            data_items = self.lafapi.data_items
-            order = data_items[Names.comp('mG00', ('node_sort_inv',))]
-            for x in sorted(cn.keys(), key=lambda x:order[x]): yield x
-        else:
-            for x in alookup.get(n, {}).keys(): yield x
-            for x in lookup.get(n, {}).keys(): yield x
+        for x in (self._sorted_data() if sort else self.data).get(n, {}).keys(): yield x
 
     def vv(self, n, sort=False):
-        lookup = self.lookup
-        alookup = self.alookup
-        if sort:
-            cn = lookup.get(n, {})
-            cn.update(alookup.get(n, {}))
-            data_items = self.lafapi.data_items
-            order = data_items[Names.comp('mG00', ('node_sort_inv',))]
-            for x in sorted(cn.items(), key=lambda x:order[x[0]]): yield x
-        else:
-            for x in alookup.get(n, {}).items(): yield x
-            for x in lookup.get(n, {}).items(): yield x
+        for x in (self._sorted_data() if sort else self.data).get(n, {}).items(): yield x
 
-    def endnodes(self, node_set, value=None, sort=False):
+    def pairs(self, value=None):
+        efeature = self.lafapi.elements.get(('F', 'e', self.feature))
+        if efeature == None:
+            edges = sorted((n, m) for (n, adj) in self.data.items() for (m, v) in adj.items() if value == None or v == value)
+            code = array_code(max(max(e) for e in edges) if edges else 0)
+            return (array.array(code, (e[0] for e in edges)), array.array(code, (e[1] for e in edges)))
         data_items = self.lafapi.data_items
-        order = data_items[Names.comp('mG00', ('node_sort_inv',))]
-        visited = set()
+        ends = (data_items[Names.comp('mG00', ('edges_from',))], data_items[Names.comp('mG00', ('edges_to',))])
+        (sources, targets) = ends if self.inv == 'f' else reversed(ends)
+        edges = efeature.postings(value)
+        return (array.array(sources.typecode, (sources[e] for e in edges)), array.array(targets.typecode, (targets[e] for e in edges)))
+
+    def arrays(self, value=None):
+        if value not in self._adjacency: self._adjacency[value] = adjacency(self.data, value)
+        return self._adjacency[value]
+
+    def _sinks(self, nodes, value):
+        (offsets, targets) = self.arrays(value)
+        memo = self._memo.setdefault(value, collections.OrderedDict())
+        found = reachable_sinks(nodes, offsets, targets, memo)
+        result = {}
+        for n in nodes:
+            if n in found:
+                result[n] = found[n]
+                memo[n] = found[n]
+            else:
+                result[n] = memo[n]
+                memo.move_to_end(n)
+        while len(memo) > self.memo_size: memo.popitem(last=False)
+        return result
+
+    def _sorted(self, nodes):
+        data_items = self.lafapi.data_items
+        return backend.canonical(nodes, data_items[Names.comp('mG00', ('node_sort',))], data_items[Names.comp('mG00', ('node_sort_inv',))])
+
+    def endnodes(self, node_set, value=None, sort=False):
         result = set()
-        next_set = set(node_set)
-        while next_set:
-            new_next_set = set()
-            for node in next_set:
-                visited.add(node)
-                next_nodes = set(self.v(node)) if value == None else set([n[0] for n in self.vv(node) if n[1] == value])
-                if next_nodes: new_next_set |= next_nodes - visited
-                else: result.add(node)
-            next_set = new_next_set
-        the_nodes = sorted(result, key=lambda x:order[x]) if sort else result
-        for n in the_nodes: yield n
+        for sinks in self._sinks(set(node_set), value).values(): result |= sinks
+        for n in (self._sorted(result) if sort else result): yield n
+
+    def endnodes_many(self, nodes, value=None, sort=False):
+        return dict((n, self._sorted(sinks) if sort else sinks) for (n, sinks) in self._sinks(set(nodes), value).items())
 
 class XMLid(object):
     '''Mappings between XML identifiers in original LAF resource and integers identifying nodes and edges in compiled data.
 
     ``r(node or edge int) = xml identifier`` and ``i(xml identifier) = node or edge int``.
     '''
-    def __init__(self, lafapi, kind):
+    def __init__(self, lafapi, kind, reuse=None):
         env = lafapi.names.env
         self.kind = kind
         data_items = lafapi.data_items
@@ -119,15 +337,17 @@ class XMLid(object):
         arlabels = [Names.comp('a{}:X{}b'.format(anx, kind), ()) for anx in env['annox']] 
         self.lookup = data_items[label] if label in data_items else {}
         self.rlookup = data_items[rlabel] if rlabel in data_items else {}
-        self.alookup = {}
-        self.arlookup = {}
-        for alabel in alabels:
-            if alabel in data_items: self.alookup.update(data_items[alabel])
-        for arlabel in arlabels:
-            if arlabel in data_items: self.arlookup.update(data_items[arlabel])
+        alayers = tuple(data_items[alabel] for alabel in alabels if alabel in data_items)
+        arlayers = tuple(data_items[arlabel] for arlabel in arlabels if arlabel in data_items)
+        self.layers = (data_items.get(label), data_items.get(rlabel)) + alayers + arlayers
+        if same_layers(reuse, self.layers):
+            (self.data, self.rdata) = (reuse.data, reuse.rdata)
+        else:
+            self.data = overlay(self.lookup, alayers)
+            self.rdata = overlay(self.rlookup, arlayers)
 
-    def r(self, int_code): return self.arlookup.get(int_code, self.rlookup.get(int_code))
-    def i(self, xml_id): return self.alookup.get(xml_id, self.lookup.get(xml_id))
+    def r(self, int_code): return self.rdata.get(int_code)
+    def i(self, xml_id): return self.data.get(xml_id)
 
 class PrimaryData(object):
     '''Primary data.
@@ -135,21 +355,277 @@ class PrimaryData(object):
     ``data(node)`` is a list of chunks of primary data attached to that node.
     The chunk is delivered as a pair of the position where the chunk starts and the chunk itself.
     Empty chunks are possible. Consecutive chunks have been merged. The chunks appear in primary data order.
+    ``data_many(nodes)`` gives the same for a whole sequence of nodes, as a list.
+    ``text(nodes, sep='')`` gives the text of the nodes, joined by ``sep``, the chunks of a node joined without separator.
+
+    ``find(string)`` gives the positions where ``string`` occurs, ``search(pattern)`` the ``(start, end)`` of the matches of a regular expression.
+    They use an index of the positions of all ``GRAM``-character strings in the primary data, built at the first search.
+    Mapped primary data is searched in windows of two ``BLOCK``s with ``CONTEXT`` characters before them.
+    A window is doubled as long as a match runs to less than ``CONTEXT`` characters from its end.
+    ``containing(start, end)`` gives the nodes whose span contains the stretch from ``start`` to ``end``.
     '''
-    def __init__(self, lafapi):
+    GRAM = 3
+    BLOCK = 1 << 16
+    CONTEXT = 256
+
+    def __init__(self, lafapi, reuse=None):
         self.all_data = lafapi.data_items[Names.comp('mP00', ('primary_data',))]
         self.lafapi = lafapi
+        self.grams = reuse.grams if reuse != None and reuse.all_data is self.all_data else None
 
-    def data(self, node):
-        lafapi = self.lafapi
-        regions = lafapi._getitems(
-            lafapi.data_items[Names.comp('mP00', ('node_anchor',))],
-            lafapi.data_items[Names.comp('mP00', ('node_anchor_items',))],
-            node,
-        )
-        if not regions: return None
+    def _blocks(self, overlap):
+        all_text = self.all_data
+        for b in range(0, len(all_text), self.BLOCK): yield (b, all_text[b:b + self.BLOCK + overlap])
+
+    def _grams(self):
+        if self.grams == None:
+            self.lafapi.stamp.Imsg("Indexing primary data ...")
+            (g, code) = (self.GRAM, array_code(len(self.all_data)))
+            grams = collections.defaultdict(lambda: array.array(code))
+            for (b, chunk) in self._blocks(g - 1):
+                for i in range(min(self.BLOCK, len(chunk) - g + 1)): grams[chunk[i:i + g]].append(b + i)
+            self.grams = dict(grams)
+            self.lafapi.stamp.Imsg("Done: {} distinct strings of length {}".format(len(self.grams), g))
+        return self.grams
+
+    def find(self, string):
+        g = self.GRAM
         all_text = self.all_data
+        code = array_code(len(all_text))
+        if not string: return array.array(code, range(len(all_text) + 1))
+        if len(string) < g:
+            result = array.array(code)
+            for (b, chunk) in self._blocks(len(string) - 1):
+                i = chunk.find(string)
+                while 0 <= i < self.BLOCK:
+                    result.append(b + i)
+                    i = chunk.find(string, i + 1)
+            return result
+        grams = self._grams()
+        empty = array.array(code)
+        (k, positions) = min(((k, grams.get(string[k:k + g], empty)) for k in range(len(string) - g + 1)), key=lambda x: len(x[1]))
+        return array.array(code, (p - k for p in positions if p >= k and all_text[p - k:p - k + len(string)] == string))
+
+    def _window(self, start, size):
+        b = max(0, start - self.CONTEXT)
+        return (b, self.all_data[b:start + size])
+
+    def _match(self, regex, p):
+        all_text = self.all_data
+        if isinstance(all_text, str):
+            m = regex.match(all_text, p)
+            return None if m == None else m.span()
+        size = 2 * self.BLOCK
+        while True:
+            (b, text) = self._window(p, size)
+            m = regex.match(text, p - b)
+            if m == None: return None
+            if m.end() <= len(text) - self.CONTEXT or b + len(text) >= len(all_text): return (b + m.start(), b + m.end())
+            size *= 2
+
+    def _scan(self, regex):
+        all_text = self.all_data
+        if isinstance(all_text, str):
+            for m in regex.finditer(all_text): yield m.span()
+            return
+        (pos, size, last) = (0, 2 * self.BLOCK, None)
+        while True:
+            (b, text) = self._window(pos, size)
+            whole = b + len(text) >= len(all_text)
+            (nxt, size) = (None, 2 * self.BLOCK)
+            for m in regex.finditer(text, pos - b):
+                span = (b + m.start(), b + m.end())
+                if whole: pass
+                elif m.end() > len(text) - self.CONTEXT:
+                    if span[0] == pos: size = 2 * len(text)
+                    nxt = span[0]
+                    break
+                elif span[0] >= pos + self.BLOCK: break
+                if span == last and span[0] == span[1]: continue
+                yield span
+                last = span
+            else:
+                if whole: return
+            pos = nxt if nxt != None else pos + self.BLOCK if last == None else max(pos + self.BLOCK, last[1])
+
+    def search(self, pattern, flags=0):
+        regex = re.compile(pattern, flags)
+        prefix = regex_prefix(pattern, flags)
+        if len(prefix) < self.GRAM: return list(self._scan(regex))
         result = []
-        for r in grouper(regions, 2): result.append((r[0], all_text[r[0]:r[1]]))
+        end = 0
+        for p in self.find(prefix):
+            if p < end: continue
+            span = self._match(regex, p)
+            if span:
+                result.append(span)
+                end = span[1]
         return result
 
+    def containing(self, start, end=None, test=None, value=None):
+        if end == None or end < start + 1: end = start + 1
+        anchors = self.lafapi.api['A']
+        result = [n for n in anchors.stab(start) if anchors.amax[n] - 1 >= end]
+        return result if test == None else [n for n in result if test(n) == value]
+
+    def _chunks(self, nodes):
+        data_items = self.lafapi.data_items
+        node_anchor = data_items[Names.comp('mP00', ('node_anchor',))]
+        node_anchor_items = data_items[Names.comp('mP00', ('node_anchor_items',))]
+        all_text = self.all_data
+        for node in nodes:
+            i = node_anchor[node]
+            n = node_anchor_items[i]
+            yield [(node_anchor_items[j], all_text[node_anchor_items[j]:node_anchor_items[j + 1]]) for j in range(i + 1, i + 1 + n, 2)] or None
+
+    def data(self, node): return next(self._chunks((node,)))
+    def data_many(self, nodes): return list(self._chunks(nodes))
+
+    def text(self, nodes, sep=''):
+        return sep.join(''.join(chunk for (pos, chunk) in chunks) for chunks in self._chunks(nodes) if chunks != None)
+
+
+class AnchorIndex(object):
+    '''Interval index over the anchors of nodes.
+
+    A node spans the anchors from its first to its last anchor,
+    and covers the characters from its first anchor up to but not including its last one.
+
+    ``stab(pos)`` yields the nodes that cover the character at position ``pos``.
+    ``overlap(start, end)`` yields the nodes that cover at least one character of ``start`` up to ``end``.
+    ``within(start, end)`` yields the nodes whose anchors lie between ``start`` and ``end`` inclusive.
+    ``u(node)`` is the immediate container of a node, ``d(node)`` the nodes immediately contained in it.
+
+    With ``gaps=True``, ``stab()`` and ``overlap()`` check the ranges of the node itself instead of its span,
+    which needs the primary data.
+    All queries return nodes in the canonical order (see ``NK``).
+    The indexes are built at the first query that needs them.
+    '''
+    def __init__(self, lafapi):
+        self.lafapi = lafapi
+        data_items = lafapi.data_items
+        self.amin = data_items[Names.comp('mG00', ('node_anchor_min',))]
+        self.amax = data_items[Names.comp('mG00', ('node_anchor_max',))]
+        self.by_start = None
+        self.tree = None
+        self.embedding = None
+
+    def _embedding(self):
+        if self.embedding != None: return self.embedding
+        lafapi = self.lafapi
+        data_items = lafapi.data_items
+        keys = [Names.comp('mE00', (name,)) for name in ('node_container', 'node_children', 'node_children_items')]
+        if not all(key in data_items for key in keys):
+            lafapi.stamp.Wmsg("Embedding not in compiled data (compiled by an older version?). Computing it now ...")
+            for (key, data) in zip(keys, containment(self._by_start(), self.amin, self.amax)): data_items[key] = data
+            lafapi.stamp.Imsg("Done")
+        self.embedding = tuple(data_items[key] for key in keys)
+        return self.embedding
+
+    def u(self, node):
+        parent = self._embedding()[0][node]
+        return None if parent == 0 else parent - 1
+
+    def d(self, node):
+        (node_container, node_children, node_children_items) = self._embedding()
+        return tuple(self.lafapi._getitems(node_children, node_children_items, node))
+
+    def _order(self, nodes):
+        order_key = self.lafapi.data_items[Names.comp('mG00', ('node_sort_inv',))]
+        return sorted(nodes, key=lambda n: order_key[n])
+
+    def _by_start(self):
+        if self.by_start == None:
+            (amin, amax) = (self.amin, self.amax)
+            anchored = (n for n in range(len(amax)) if amax[n] > 0)
+            self.by_start = array.array('I', sorted(anchored, key=lambda n: (amin[n], -amax[n])))
+        return self.by_start
+
+    def _tree(self):
+        '''Centred interval tree over the non-empty spans.
+
+        Every tree node has a centre, the spans that contain the centre
+        (once ordered by start, once by descending end), and a left and right subtree
+        with the spans that end before and start after the centre.
+        '''
+        if self.tree != None: return self.tree
+        (amin, amax) = (self.amin, self.amax)
+        (centres, lefts, rights, bounds) = (array.array('I'), array.array('i'), array.array('i'), array.array('I', [0]))
+        (starts, ends) = (array.array('I'), array.array('I'))
+        def build(nodes):
+            if not nodes: return -1
+            centre = amin[nodes[len(nodes) // 2]]
+            (left, mid, right) = ([], [], [])
+            for n in nodes:
+                if amax[n] <= centre: left.append(n)
+                elif amin[n] > centre: right.append(n)
+                else: mid.append(n)
+            t = len(centres)
+            centres.append(centre)
+            starts.extend(mid)
+            ends.extend(sorted(mid, key=lambda n: -amax[n]))
+            bounds.append(len(starts))
+            lefts.append(-1)
+            rights.append(-1)
+            lefts[t] = build(left)
+            rights[t] = build(right)
+            return t
+        build([n for n in self._by_start() if amin[n] < amax[n]])
+        self.tree = (centres, lefts, rights, bounds, starts, ends)
+        return self.tree
+
+    def _stab(self, pos):
+        (amin, amax) = (self.amin, self.amax)
+        (centres, lefts, rights, bounds, starts, ends) = self._tree()
+        a = pos + 1
+        result = []
+        t = 0 if centres else -1
+        while t != -1:
+            centre = centres[t]
+            (b, e) = (bounds[t], bounds[t + 1])
+            if a < centre:
+                for i in range(b, e):
+                    n = starts[i]
+                    if amin[n] > a: break
+                    result.append(n)
+                t = lefts[t]
+            else:
+                for i in range(b, e):
+                    n = ends[i]
+                    if amax[n] <= a: break
+                    result.append(n)
+                t = rights[t] if a > centre else -1
+        return result
+
+    def _covers(self, node, start, end):
+        lafapi = self.lafapi
+        data_items = lafapi.data_items
+        node_anchor = Names.comp('mP00', ('node_anchor',))
+        if node_anchor not in data_items:
+            raise FabricError("Node ranges not available because primary data is not loaded.", lafapi.stamp)
+        ranges = lafapi._getitems(data_items[node_anchor], data_items[Names.comp('mP00', ('node_anchor_items',))], node)
+        for (b, e) in grouper(ranges, 2):
+            if b < end and e > start: return True
+        return False
+
+    def stab(self, pos, gaps=False):
+        result = self._stab(pos)
+        if gaps: result = [n for n in result if self._covers(n, pos, pos + 1)]
+        return self._order(result)
+
+    def overlap(self, start, end, gaps=False):
+        if end <= start: return []
+        by_start = self._by_start()
+        amin = self.amin
+        lo = bisect_by(by_start, start + 2, lambda n: amin[n])
+        hi = bisect_by(by_start, end + 1, lambda n: amin[n], lo=lo)
+        result = self._stab(start) + [n for n in by_start[lo:hi] if self.amax[n] > amin[n]]
+        if gaps: result = [n for n in result if self._covers(n, start, end)]
+        return self._order(result)
+
+    def within(self, start, end):
+        by_start = self._by_start()
+        (amin, amax) = (self.amin, self.amax)
+        lo = bisect_by(by_start, start + 1, lambda n: amin[n])
+        hi = bisect_by(by_start, end + 2, lambda n: amin[n], lo=lo)
+        return self._order(n for n in by_start[lo:hi] if amax[n] <= end + 1)
@@ -1,23 +1,31 @@
 import os
 import glob
 import collections
-import functools
 import time
-from .lib import make_array_inverse
+import array
+import bisect
+from .lib import make_array_inverse, sort_runs, anchor_set_key, array_code
 from .names import Names, FabricError
 from .data import LafData
-from .elements import Feature, Connection, XMLid, PrimaryData
+from .elements import Feature, Connection, XMLid, PrimaryData, AnchorIndex
 
 class LafAPI(LafData):
     '''Makes all API methods available.
     ``API()`` returns a dict keyed by mnemonics and valued by API methods.
+
+    The orders of all nodes that ``NN()`` computes for an ``extrakey`` are remembered for the last ``resorted_size`` functions,
+    the event streams of ``NE(cache=True)`` for the last ``event_streams_size`` combinations of ``key`` and ``simplify``.
     '''
+    resorted_size = 4
+    event_streams_size = 2
+
     def __init__(self, names):
         self.api = {}
         self.names = names
         self.stamp = names.stamp
         LafData.__init__(self)
         self.result_files = []
+        self.elements = {}
 
     def API(self):
         self._api_fcxp()
@@ -75,7 +83,7 @@ class LafAPI(LafData):
             if dgroup == 'F': features[dkind].add(dcomps)
             elif dgroup == 'C': connections[ddir].add(dcomps)
             elif dgroup == 'X': xmlmaps[dkind].add(dcomps)
-            elif dgroup == 'P' and dcomps[0] == 'primary_data': api['P'] = PrimaryData(self)
+            elif dgroup == 'P' and dcomps[0] == 'primary_data': api['P'] = PrimaryData(self, reuse=self.elements.get(('P',)))
         self.feature_abbs = collections.defaultdict(lambda: set())
         self.feature_abb = {}
         for kind in sorted(features):
@@ -90,10 +98,12 @@ class LafAPI(LafData):
             chosen = self.feature_abb[abb]
             if len(expansions) > 1:
                 self.stamp.Imsg("Feature {} refers to {}, not to {}".format(abb, chosen, ', '.join(sorted(expansions - set([chosen])))))
+        elements = {}
         for kind in features:
             for feat in features[kind]:
                 name = Names.apiname(feat) 
-                obj = Feature(self, feat, kind)
+                obj = Feature(self, feat, kind, reuse=self.elements.get(('F', kind, feat)))
+                elements[('F', kind, feat)] = obj
                 dest = api['FE'] if kind == 'e' else api['F']
                 dest.item[name] = obj
                 setattr(dest, name, obj)
@@ -104,7 +114,8 @@ class LafAPI(LafData):
         for inv in connections:
             for feat in connections[inv]:
                 name = Names.apiname(feat) 
-                obj = Connection(self, feat, inv)
+                obj = Connection(self, feat, inv, reuse=self.elements.get(('C', inv, feat)))
+                elements[('C', inv, feat)] = obj
                 dest = api['C'] if inv == 'f' else api['Ci'] if inv == 'b' else None
                 dest.item[name] = obj
                 setattr(dest, name, obj)
@@ -114,9 +125,12 @@ class LafAPI(LafData):
                         dest.item[abb] = obj
         for kind in xmlmaps:
             for comp in xmlmaps[kind]:
-                obj = XMLid(self, kind)
+                obj = XMLid(self, kind, reuse=self.elements.get(('X', kind)))
+                elements[('X', kind)] = obj
                 dest = 'XE' if kind == 'e' else 'X'
                 api[dest] = obj
+        if 'P' in api: elements[('P',)] = api['P']
+        self.elements = elements
 
         def feature_list(kind):
             result = []
@@ -153,12 +167,37 @@ class LafAPI(LafData):
         edges_from = data_items[Names.comp('mG00', ('edges_from',))]
         edges_to = data_items[Names.comp('mG00', ('edges_to',))]
 
-        def next_edge():
-            for e in range(len(edges_from)):
-                yield (e, edges_from[e], edges_to[e])
+        def next_edge(chunk=None):
+            if chunk == None:
+                for e in range(len(edges_from)):
+                    yield (e, edges_from[e], edges_to[e])
+                return
+            code = array_code(len(edges_from))
+            for e in range(0, len(edges_from), chunk):
+                yield (array.array(code, range(e, min(e + chunk, len(edges_from)))), edges_from[e:e + chunk], edges_to[e:e + chunk])
+
+        def edge_table(feature, value=None, node_features=()):
+            FE = self.api['FE'].item
+            F = self.api['F'].item
+            if feature not in FE: raise FabricError("Edge feature {} not loaded".format(feature), self.stamp)
+            for nfeature in node_features:
+                if nfeature not in F: raise FabricError("Node feature {} not loaded".format(nfeature), self.stamp)
+            efeature = FE[feature]
+            edges = efeature.postings(value)
+            table = {
+                'edge': edges[:],
+                'from': array.array(edges_from.typecode, map(edges_from.__getitem__, edges)),
+                'to': array.array(edges_to.typecode, map(edges_to.__getitem__, edges)),
+            }
+            table['value'] = [value] * len(edges) if value != None else list(map(efeature.data.__getitem__, edges))
+            for nfeature in node_features:
+                ndata = F[nfeature].data
+                for end in ('from', 'to'): table['{}.{}'.format(end, nfeature)] = list(map(ndata.get, table[end]))
+            return table
 
         self.api.update({
             'EE':      next_edge,
+            'ET':      edge_table,
         })
 
     def _api_nodes(self):
@@ -176,50 +215,39 @@ class LafAPI(LafData):
 
         def node_sort_key(node): return data_items[Names.comp('mG00', ('node_sort_inv',))][node]
 
-        def msetbefore(sa,sb):
-            if sa == sb: return 0
-            if sa <= sb: return 1
-            if sb <= sa: return -1
-            am = min(sa - sb)
-            bm = min(sb - sa)
-            return -1 if am < bm else 1 if bm < am else None
-        msetkey = functools.cmp_to_key(msetbefore)
-
-        def next_node(nodes=None, test=None, value=None, values=None, extrakey=None):
-            class Extra_key(object):
-                __slots__ = ['value', 'amin', 'amax']
-                def __init__(self, node):
-                    self.amin = node_anchor_min[node] - 1
-                    self.amax = node_anchor_max[node] - 1
-                    self.value = extrakey(node)
-                def __lt__(self, other):
-                    return (
-                        self.amin == other.amin and
-                        self.amax == other.amax and
-                        self.value < other.value
-                    )
-                def __gt__(self, other):
-                    return (
-                        self.amin == other.amin and
-                        self.amax == other.amax and
-                        self.value > other.value
-                    )
-                def __eq__(self, other):
-                    return (
-                        self.amin != other.amin or
-                        self.amax != other.amax or
-                        self.value == other.value
-                    )
-                __hash__ = None
+        def msetkey(aset): return aset.sort_key() if hasattr(aset, 'sort_key') else anchor_set_key(aset)
+
+        def node_run(node): return (node_anchor_min[node], node_anchor_max[node])
+        resorted = collections.OrderedDict()
+
+        def node_anchors(node):
+            if node_anchor_max[node] == 0: return None
+            return (node_anchor_min[node] - 1, node_anchor_max[node] - 1)
 
+        def in_window(node, start, end): return node_anchor_min[node] > start and 0 < node_anchor_max[node] <= end + 1
+
+        anchor_index = AnchorIndex(self)
+
+        def next_node(nodes=None, test=None, value=None, values=None, extrakey=None, anchor_range=None):
             order = data_items[Names.comp('mG00', ('node_sort',))]
             order_key = data_items[Names.comp('mG00', ('node_sort_inv',))]
-            the_nodes = sorted(nodes, key=lambda x: order_key[x]) if nodes else order
+            if anchor_range == None: the_nodes = sorted(nodes, key=lambda x: order_key[x]) if nodes else order
+            else:
+                (start, end) = anchor_range
+                if nodes: the_nodes = sorted((n for n in nodes if in_window(n, start, end)), key=lambda x: order_key[x])
+                else: the_nodes = anchor_index.within(start, end)
 
             if extrakey != None:
-                self.stamp.Imsg("Resorting {} nodes...".format(len(the_nodes)))
-                the_nodes = sorted(the_nodes, key=Extra_key)
-                self.stamp.Imsg("Done")
+                if nodes or anchor_range != None:
+                    the_nodes = sort_runs(the_nodes, node_run, extrakey)
+                else:
+                    if extrakey in resorted: resorted.move_to_end(extrakey)
+                    else:
+                        self.stamp.Imsg("Resorting {} nodes...".format(len(the_nodes)))
+                        resorted[extrakey] = array.array('I', sort_runs(the_nodes, node_run, extrakey))
+                        self.stamp.Imsg("Done")
+                        while len(resorted) > self.resorted_size: resorted.popitem(last=False)
+                    the_nodes = resorted[extrakey]
             if test != None:
                 test_values = set(([value] if value != None else []) + (list(values) if values != None else []))
                 if len(test_values):
@@ -231,63 +259,59 @@ class LafAPI(LafData):
             else:
                 for node in the_nodes: yield node
 
-        def no_next_event(key=None, simplify=None):
+        def no_next_event(key=None, simplify=None, cache=False, start_anchor=None, end_anchor=None):
             raise FabricError("Node events not available because primary data is not loaded.", self.stamp)
             return None
 
-        def next_event(key=None, simplify=None):
-            class Additional_key(object):
-                __slots__ = ['value', 'kind', 'amin', 'amax']
-                def __init__(self, event):
-                    (node, kind) = event
-                    self.amin = node_anchor_min[node] - 1
-                    self.amax = node_anchor_max[node] - 1
-                    self.value = key(node) * (-1 if kind < 2 else 1)
-                    self.kind = kind
-                def __lt__(self, other):
-                    return (
-                        self.amin == other.amin and
-                        self.amax == other.amax and
-                        (self.kind == other.kind or self.amin == self.amax) and
-                        self.value < other.value
-                    )
-                def __gt__(self, other):
-                    return (
-                        self.amin == other.amin and
-                        self.amax == other.amax and
-                        (self.kind == other.kind or self.amin == self.amax) and
-                        self.value > other.value
-                    )
-                def __eq__(self, other):
-                    return (
-                        self.amin != other.amin or
-                        self.amax != other.amax or
-                        (self.kind != other.kind and (self.amin != self.amax or other.amin != other.amax)) or
-                        self.value == other.value
-                    )
-                __hash__ = None
+        def event_run(event):
+            node = event[0]
+            amin = node_anchor_min[node]
+            amax = node_anchor_max[node]
+            return (amin, amax) if amin == amax else (amin, amax, event[1])
 
+        def event_key(event): return event[2]
+
+        event_streams = collections.OrderedDict()
+
+        def make_events(key, simplify, start_anchor, end_anchor):
             nodes = data_items[Names.comp('mP00', ('node_events_n',))]
             kinds = data_items[Names.comp('mP00', ('node_events_k',))]
             node_events = data_items[Names.comp('mP00', ('node_events',))]
             node_events_items = data_items[Names.comp('mP00', ('node_events_items',))]
             bufferevents = collections.deque([(-1, [])], 2)
 
-            active = {}
-            for anchor in range(len(node_events)):
+            def events_at(anchor):
                 event_ids = self._getitems(node_events, node_events_items, anchor)
-                if len(event_ids) == 0: continue
-                eventset = []
+                if key == None: return [(nodes[event_id], kinds[event_id]) for event_id in event_ids]
+                keyed = []
                 for event_id in event_ids:
                     node = nodes[event_id]
-                    if key == None or key(node) != None: eventset.append((nodes[event_id], kinds[event_id]))
+                    value = key(node)
+                    if value != None:
+                        kind = kinds[event_id]
+                        keyed.append((node, kind, -value if kind < 2 else value))
+                return [(n, k) for (n, k, v) in sort_runs(keyed, event_run, event_key)]
+
+            active = {}
+            lo = 0 if start_anchor == None else max(start_anchor, 0)
+            hi = len(node_events) if end_anchor == None else min(end_anchor + 1, len(node_events))
+            if simplify != None and lo > 0:
+                active = dict((n, True) for n in anchor_index.stab(lo - 1, gaps=True) if simplify(n))
+                for anchor in range(min(lo, len(node_events)) - 1, -1, -1):
+                    eventset = events_at(anchor)
+                    if eventset:
+                        bufferevents.append([anchor, eventset])
+                        break
+            for anchor in range(lo, hi if simplify == None else len(node_events)):
+                eventset = events_at(anchor)
                 if not eventset: continue
-                if key != None: eventset = sorted(eventset, key=Additional_key)
                 if simplify == None:
                     yield (anchor, eventset)
                     continue
                 bufferevents.append([anchor, eventset])
-                if bufferevents[0][0] == -1: continue
+                if bufferevents[0][0] == -1:
+                    if anchor >= hi: break
+                    continue
                 (this_anchor, these_events) = bufferevents[0]
                 (next_anchor, next_events) = bufferevents[1]
                 deleted = {}
@@ -309,14 +333,56 @@ class LafAPI(LafData):
                     if True in weed.values():
                         bufferevents[0][1] = [(n, k) for (n, k) in these_events if not (k == 2 and weed[n])] 
                         bufferevents[1][1] = [(n, k) for (n, k) in next_events if not (k == 1 and weed[n])] 
-                yield (bufferevents[0])
-            yield (bufferevents[0])
+                        for n in weed:
+                            if weed[n] and simplify(n): active[n] = True
+                if this_anchor >= lo: yield (bufferevents[0])
+                if anchor >= hi: break
+            else:
+                if simplify != None and bufferevents[-1][0] >= lo: yield (bufferevents[-1])
+
+        def make_event_stream(key, simplify):
+            ev_anchors = array.array('I')
+            ev_index = array.array('I', [0])
+            ev_nodes = array.array('I')
+            ev_kinds = array.array('B')
+            for (anchor, events) in make_events(key, simplify, None, None):
+                ev_anchors.append(anchor)
+                for (n, k) in events:
+                    ev_nodes.append(n)
+                    ev_kinds.append(k)
+                ev_index.append(len(ev_nodes))
+            return (ev_anchors, ev_index, ev_nodes, ev_kinds)
+
+        def replay_events(stream, lo, hi):
+            (ev_anchors, ev_index, ev_nodes, ev_kinds) = stream
+            for i in range(lo, hi):
+                (b, e) = (ev_index[i], ev_index[i + 1])
+                yield (ev_anchors[i], list(zip(ev_nodes[b:e], ev_kinds[b:e])))
+
+        def next_event(key=None, simplify=None, cache=False, start_anchor=None, end_anchor=None):
+            if not cache:
+                for x in make_events(key, simplify, start_anchor, end_anchor): yield x
+                return
+            spec = (key, simplify)
+            if spec in event_streams: event_streams.move_to_end(spec)
+            else:
+                self.stamp.Imsg("Materializing node events ...")
+                event_streams[spec] = make_event_stream(key, simplify)
+                self.stamp.Imsg("Done: {} event sets".format(len(event_streams[spec][0])))
+                while len(event_streams) > self.event_streams_size: event_streams.popitem(last=False)
+            stream = event_streams[spec]
+            ev_anchors = stream[0]
+            lo = 0 if start_anchor == None else bisect.bisect_left(ev_anchors, start_anchor)
+            hi = len(ev_anchors) if end_anchor == None else bisect.bisect_right(ev_anchors, end_anchor)
+            for x in replay_events(stream, lo, hi): yield x
 
         self.api.update({
             'BF':      before,
             'NN':      next_node,
             'NE':      next_event if Names.comp('mP00', ('node_events',)) in data_items else no_next_event,
             'NK':      node_sort_key,
+            'NA':      node_anchors,
+            'A':       anchor_index,
             'MK':      msetkey,
         })
 
@@ -395,7 +461,9 @@ class LafFabric(object):
         req_items = {}
         lafapi.names.request_init(req_items)
         lafapi.get_all_features()
-        if 'primary' in load_spec and load_spec['primary']: req_items['mP00'] = True
+        if 'primary' in load_spec and load_spec['primary']:
+            req_items['mP00'] = True
+            lafapi.primary_mmap = load_spec['primary'] == 'mmap'
         if 'xmlids' in load_spec:
             for kind in [k[0] for k in load_spec['xmlids'] if load_spec['xmlids'][k]]:
                 for ddir in ('f', 'b'): req_items['mX{}{}'.format(kind, ddir)].append(())
@@ -0,0 +1,130 @@
+'''Graph algorithms over the connectivity of an edge feature.
+
+The functions take a connection table such as ``C.mother`` or ``Ci.mother`` and work on its array form
+(``arrays(value)``), so walking is along the direction of that table.
+With ``value`` only the edges on which the feature has that value count.
+Node sets come back as arrays of node numbers in increasing order.
+'''
+import array
+import collections
+from .lib import array_code
+from .names import Names
+
+def _n_node(conn): return len(conn.lafapi.data_items[Names.comp('mG00', ('node_anchor_min',))])
+
+def _nexts(offsets, targets, n): return targets[offsets[n]:offsets[n + 1]] if n < len(offsets) - 1 else ()
+
+def _node_array(nodes, n_node): return array.array(array_code(n_node), sorted(nodes))
+
+def degrees(conn, value=None):
+    '''The number of edges leaving each node, as an array indexed by node.'''
+    (offsets, targets) = conn.arrays(value)
+    n_node = _n_node(conn)
+    result = array.array(array_code(len(targets)), [0]) * n_node
+    for n in range(len(offsets) - 1): result[n] = offsets[n + 1] - offsets[n]
+    return result
+
+def degree_stats(conn, value=None):
+    '''Statistics of the degrees: a dict with the number of nodes with edges, the number of edges,
+    the maximum and mean degree (over nodes with edges), and a histogram ``{degree: number of nodes}``.
+    '''
+    histogram = collections.Counter(d for d in degrees(conn, value) if d)
+    nodes = sum(histogram.values())
+    edges = sum(d * k for (d, k) in histogram.items())
+    return dict(
+        nodes=nodes,
+        edges=edges,
+        max=max(histogram) if histogram else 0,
+        mean=edges / nodes if nodes else 0,
+        histogram=dict(sorted(histogram.items())),
+    )
+
+def components(conn, value=None):
+    '''The connected components, ignoring the direction of the edges.
+
+    Returns an array that gives for each node the number of its component.
+    Components are numbered from 0 in the order of their smallest node; a node without edges is a component by itself.
+    '''
+    (offsets, targets) = conn.arrays(value)
+    n_node = _n_node(conn)
+    parent = array.array(array_code(n_node), range(n_node))
+    def root(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+    for n in range(len(offsets) - 1):
+        for m in targets[offsets[n]:offsets[n + 1]]:
+            (rn, rm) = (root(n), root(m))
+            if rn < rm: parent[rm] = rn
+            elif rm < rn: parent[rn] = rm
+    result = array.array(array_code(n_node), [0]) * n_node
+    n_comp = 0
+    for n in range(n_node):
+        r = root(n)
+        if r == n:
+            result[n] = n_comp
+            n_comp += 1
+        else: result[n] = result[r]
+    return result
+
+def closure(conn, node, value=None, max_depth=None):
+    '''All nodes that can be reached from ``node``, with their distance.
+
+    With ``Ci.mother`` these are the descendants, with ``C.mother`` the ancestors of ``node``.
+    Returns a pair of arrays: the nodes in increasing order, and their depths (``node`` itself not included).
+    Walking stops at ``max_depth`` if given.
+    '''
+    (offsets, targets) = conn.arrays(value)
+    depth = {node: 0}
+    layer = [node]
+    d = 0
+    while layer and (max_depth == None or d < max_depth):
+        d += 1
+        new_layer = []
+        for n in layer:
+            for m in _nexts(offsets, targets, n):
+                if m in depth: continue
+                depth[m] = d
+                new_layer.append(m)
+        layer = new_layer
+    del depth[node]
+    nodes = _node_array(depth, _n_node(conn))
+    return (nodes, array.array(array_code(d), (depth[n] for n in nodes)))
+
+def neighbourhood(conn, nodes, k, value=None):
+    '''The nodes that can be reached from ``nodes`` in at most ``k`` steps, including ``nodes`` themselves, as an array.'''
+    (offsets, targets) = conn.arrays(value)
+    seen = set(nodes)
+    layer = list(seen)
+    for i in range(k):
+        new_layer = []
+        for n in layer:
+            for m in _nexts(offsets, targets, n):
+                if m in seen: continue
+                seen.add(m)
+                new_layer.append(m)
+        if not new_layer: break
+        layer = new_layer
+    return _node_array(seen, _n_node(conn))
+
+def shortest_path(conn, source, target, value=None):
+    '''A shortest path from ``source`` to ``target`` as an array of nodes from ``source`` to ``target``, or ``None`` if there is no path.'''
+    (offsets, targets) = conn.arrays(value)
+    code = array_code(_n_node(conn))
+    if source == target: return array.array(code, [source])
+    previous = {source: None}
+    layer = [source]
+    while layer:
+        new_layer = []
+        for n in layer:
+            for m in _nexts(offsets, targets, n):
+                if m in previous: continue
+                previous[m] = n
+                if m == target:
+                    path = [m]
+                    while previous[path[-1]] != None: path.append(previous[path[-1]])
+                    return array.array(code, reversed(path))
+                new_layer.append(m)
+        layer = new_layer
+    return None
@@ -1,4 +1,5 @@
 import array
+import re
 from itertools import zip_longest
 
 def grouper(iterable, n, fillvalue=None):
@@ -9,9 +10,23 @@ def grouper(iterable, n, fillvalue=None):
     args = [iter(iterable)] * n
     return zip_longest(*args, fillvalue=fillvalue)
 
-def arrayify(source_list):
-    dest_array = array.array('I')
-    dests_array = array.array('I')
+array_codes = ('B', 'H', 'I', 'Q')
+
+def array_code(top):
+    '''The narrowest unsigned typecode of which the items can hold ``top``.'''
+    for code in array_codes:
+        if top < 1 << (8 * array.array(code).itemsize): return code
+    raise OverflowError("{} does not fit in an array item".format(top))
+
+def narrow_array(data):
+    '''The array ``data`` with the narrowest unsigned typecode for its values; ``data`` itself if it is that narrow already.'''
+    if data.typecode not in array_codes: return data
+    code = array_code(max(data) if len(data) else 0)
+    return data if code == data.typecode else array.array(code, data)
+
+def arrayify(source_list, code='I'):
+    dest_array = array.array(array_code(sum(len(items) for items in source_list) + len(source_list)))
+    dests_array = array.array(code)
     j = 0
     for i in range(len(source_list)):
         items = source_list[i]
@@ -21,6 +36,91 @@ def arrayify(source_list):
         j += 1 + len(items)
     return (dest_array, dests_array)
 
+def sort_runs(items, run_key, sort_key):
+    '''Sort items within maximal runs of consecutive items that have the same ``run_key``.
+
+    Items in distinct runs keep their relative order, and the sort within a run is stable.
+    ``sort_key`` is only called for items in runs of more than one item.
+    '''
+    result = []
+    run = []
+    cur_run = None
+    for item in items:
+        this_run = run_key(item)
+        if this_run != cur_run:
+            if len(run) > 1: run.sort(key=sort_key)
+            result.extend(run)
+            run = []
+            cur_run = this_run
+        run.append(item)
+    if len(run) > 1: run.sort(key=sort_key)
+    result.extend(run)
+    return result
+
+def bisect_by(items, value, key, lo=0, hi=None):
+    '''Leftmost position in ``items`` (sorted by ``key``) where ``value`` could be inserted.
+
+    Like ``bisect.bisect_left``, but compares ``key(item)`` with ``value``.
+    '''
+    if hi == None: hi = len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key(items[mid]) < value: lo = mid + 1
+        else: hi = mid
+    return lo
+
+def anchor_set_key(anchors):
+    '''Sort key for sets of integers: supersets come before their subsets,
+    otherwise the set with the smallest element not in the other set comes first.
+
+    The key consists of the maximal ranges of the set as (first, -last) pairs, closed by infinity.
+    '''
+    key = []
+    for a in sorted(anchors):
+        if key and a == 1 - key[-1]: key[-1] = -a
+        else: key.extend((a, -a))
+    key.append(float('inf'))
+    return tuple(key)
+
+def node_rank(order, n):
+    '''The position of node ``n`` according to the rank map ``order``; nodes without position come last, by number.'''
+    return order.get(n, len(order) + n)
+
+def sort_adjacency(adj, order):
+    '''The adjacency ``adj`` (a dict keyed by node) with its nodes in the order of the rank map ``order``.'''
+    return dict(sorted(adj.items(), key=lambda x: node_rank(order, x[0])))
+
+def is_sorted_adjacency(adj, order):
+    ranks = [node_rank(order, n) for n in adj]
+    return all(ranks[i] < ranks[i + 1] for i in range(len(ranks) - 1))
+
+def merge_adjacency(adj, ladj, order):
+    '''Merge the adjacency ``ladj`` over ``adj`` into one, in the order of the rank map ``order``.
+
+    Where both have the same node, the value of ``ladj`` wins.
+    The inputs need not be in that order: the order in which they were compiled may differ from ``order``.
+    '''
+    merged = dict(adj)
+    merged.update(ladj)
+    return sort_adjacency(merged, order)
+
+REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+
+def regex_prefix(pattern, flags=0):
+    '''A literal string with which every match of the regular expression ``pattern`` starts; possibly empty.
+
+    Only plain characters at the start of the pattern count. Patterns with ``|`` have no prefix,
+    nor have patterns that ignore case or are verbose, by ``flags`` or by inline flags.
+    '''
+    if '|' in pattern or re.compile(pattern, flags).flags & (re.IGNORECASE | re.VERBOSE): return ''
+    prefix = []
+    for c in pattern:
+        if c in REGEX_SPECIAL:
+            if c in '*?{' and prefix: prefix.pop()
+            break
+        prefix.append(c)
+    return ''.join(prefix)
+
 def make_inverse(mapping): return dict((y,x) for (x,y) in mapping.items())
 def make_array_inverse(arraylist): return dict((x,n) for (n,x) in enumerate(arraylist))
 
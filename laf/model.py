@@ -1,6 +1,7 @@
 import array
-from .lib import grouper, arrayify, make_inverse, make_array_inverse 
+from .lib import grouper, arrayify, array_code, make_inverse, make_array_inverse, sort_adjacency
 from .names import Names
+from . import backend
 
 def normalize_ranges(ranges):
     covered = {}
@@ -26,6 +27,47 @@ def normalize_ranges(ranges):
     if cur_end != None: result.extend((cur_start, cur_end))
     return result
 
+def containment(order, node_anchor_min, node_anchor_max):
+    '''Immediate container and children of each node, based on the anchor spans of nodes.
+
+    ``order`` lists the anchored nodes sorted by start anchor ascending and end anchor descending.
+    A node contains another node if its span contains that of the other node;
+    of two nodes with the same span the one that comes first in ``order`` contains the other.
+    The immediate container of a node is the last node before it in ``order`` that contains it.
+
+    Returns the containers as an array (container + 1, 0 if there is none)
+    and the children as a pair of arrays as made by ``arrayify``.
+    '''
+    n_node = len(node_anchor_min)
+    node_container = array.array('I', [0]) * n_node
+    n_children = array.array('I', [0]) * n_node
+    stack = []
+    for node in order:
+        (amin, amax) = (node_anchor_min[node], node_anchor_max[node])
+        while stack and (node_anchor_max[stack[-1]] < amin or (node_anchor_max[stack[-1]] == amin and amax > amin)):
+            stack.pop()
+        for i in range(len(stack) - 1, -1, -1):
+            parent = stack[i]
+            if node_anchor_max[parent] >= amax:
+                node_container[node] = parent + 1
+                n_children[parent] += 1
+                break
+        stack.append(node)
+    node_children = array.array('I', [0]) * n_node
+    node_children_items = array.array('I', [0]) * (n_node + len(order))
+    j = 0
+    for node in range(n_node):
+        node_children[node] = j
+        node_children_items[j] = n_children[node]
+        j += 1 + n_children[node]
+        n_children[node] = 0
+    for node in order:
+        parent = node_container[node] - 1
+        if parent == -1: continue
+        n_children[parent] += 1
+        node_children_items[node_children[parent] + n_children[parent]] = node
+    return (node_container, node_children, node_children_items)
+
 def model(origin, data_items, stamp):
     '''Augment the results of XML parsing by precomputing additional data structures.'''
 
@@ -44,11 +86,12 @@ def model(origin, data_items, stamp):
         n_node = len(node_region_list)
 
         stamp.Imsg("NODES ANCHOR BOUNDARIES")
-        node_anchor_min = array.array('I', (0 for i in range(n_node)))
-        node_anchor_max = array.array('I', (0 for i in range(n_node)))
-        node_linked = array.array('I')
         region_begin = data_items[Names.comp(origin + osep + 'T00', ('region_begin',))]
         region_end = data_items[Names.comp(origin + osep + 'T00', ('region_end',))]
+        anchor_code = array_code(max(region_end) + 1 if len(region_end) else 0)
+        node_anchor_min = array.array(anchor_code, [0]) * n_node
+        node_anchor_max = array.array(anchor_code, [0]) * n_node
+        node_linked = array.array('I')
         node_anchor_list = []
         for node in range(n_node):
             links = node_region_list[node]
@@ -65,7 +108,7 @@ def model(origin, data_items, stamp):
             node_anchor_list.append(norm_ranges)
             node_anchor_min[node] = min(norm_ranges) + 1
             node_anchor_max[node] = max(norm_ranges) + 1
-        (node_anchor, node_anchor_items) = arrayify(node_anchor_list)
+        (node_anchor, node_anchor_items) = arrayify(node_anchor_list, anchor_code)
         Names.deliver(node_anchor_min, (origin + osep + 'G00', ('node_anchor_min',)), data_items)
         Names.deliver(node_anchor_max, (origin + osep + 'G00', ('node_anchor_max',)), data_items)
         Names.deliver(node_anchor, (origin + osep + 'P00', ('node_anchor',)), data_items)
@@ -76,10 +119,8 @@ def model(origin, data_items, stamp):
         del data_items[Names.comp(origin + osep + 'T00', ('region_end',))]
         del data_items[Names.comp(origin + osep + 'T00', ('node_region_list',))]
 
-        def interval(node): return (node_anchor_min[node], -node_anchor_max[node])
-
         stamp.Imsg("NODES SORTING BY REGIONS")
-        node_sort = array.array('I', sorted(node_linked, key=interval))
+        node_sort = backend.sort_by_interval(node_linked, node_anchor_min, node_anchor_max)
         node_sort_inv = make_array_inverse(node_sort)
         Names.deliver(node_sort, (origin + osep + 'G00', ('node_sort',)), data_items)
         Names.deliver(node_sort_inv, (origin + osep + 'G00', ('node_sort_inv',)), data_items)
@@ -121,11 +162,23 @@ def model(origin, data_items, stamp):
         Names.deliver(node_events_items, (origin + osep + 'P00', ('node_events_items',)), data_items)
         node_anchor_list = None
 
+    def model_embedding():
+        stamp.Imsg("NODES EMBEDDING")
+        (node_container, node_children, node_children_items) = containment(
+            data_items[Names.comp(origin + osep + 'G00', ('node_sort',))],
+            data_items[Names.comp(origin + osep + 'G00', ('node_anchor_min',))],
+            data_items[Names.comp(origin + osep + 'G00', ('node_anchor_max',))],
+        )
+        Names.deliver(node_container, (origin + osep + 'E00', ('node_container',)), data_items)
+        Names.deliver(node_children, (origin + osep + 'E00', ('node_children',)), data_items)
+        Names.deliver(node_children_items, (origin + osep + 'E00', ('node_children_items',)), data_items)
+
     def model_conn():
-        node_anchor_min = data_items[Names.comp('mG00', ('node_anchor_min',))]
-        node_anchor_max = data_items[Names.comp('mG00', ('node_anchor_max',))]
+        order = data_items[Names.comp('mG00', ('node_sort_inv',))]
 
-        def interval(elem): return (node_anchor_min[elem[0]], -node_anchor_max[elem[0]])
+        def sort_conn(connections):
+            for (n, adj) in connections.items():
+                if len(adj) > 1: connections[n] = sort_adjacency(adj, order)
 
         stamp.Imsg("CONNECTIVITY")
         edges_from = data_items[Names.comp('mG00', ('edges_from',))]
@@ -146,6 +199,8 @@ def model(origin, data_items, stamp):
                 node_to = edges_to[edge]
                 connections.setdefault(node_from, {})[node_to] = fvalue
                 connectionsi.setdefault(node_to, {})[node_from] = fvalue
+            sort_conn(connections)
+            sort_conn(connectionsi)
             Names.deliver(connections, (origin + osep + 'C0f', feat), data_items)
             Names.deliver(connectionsi, (origin + osep + 'C0b', feat), data_items)
 
@@ -165,6 +220,8 @@ def model(origin, data_items, stamp):
                 node_to = edges_to[edge]
                 connections.setdefault(node_from, {})[node_to] = ''
                 connectionsi.setdefault(node_to, {})[node_from] = ''
+        sort_conn(connections)
+        sort_conn(connectionsi)
         sfeature = Names.E_ANNOT_NON if origin == 'm' else Names.E_ANNOT_YES if origin[0] == 'a' else ''
         Names.deliver(connections, (origin + osep + 'C0f', sfeature), data_items)
         Names.deliver(connectionsi, (origin + osep + 'C0b', sfeature), data_items)
@@ -172,5 +229,6 @@ def model(origin, data_items, stamp):
     if origin == 'm':
         model_x()
         model_regions()
+        model_embedding()
     model_conn()
 
@@ -68,6 +68,9 @@ class Names(Settings):
         ('mP00 node_events_n',     (False, 'arr')),
         ('mG00 node_sort',         (True,  'arr')),
         ('mG00 node_sort_inv',     (True,  'dct')),
+        ('mE00 node_container',    (True,  'arr')),
+        ('mE00 node_children',     (True,  'arr')),
+        ('mE00 node_children_items', (True, 'arr')),
         ('mG00 edges_from',        (True,  'arr')),
         ('mG00 edges_to',          (True,  'arr')),
         ('mP00 primary_data',      (False, 'str')),
@@ -81,10 +84,11 @@ class Names(Settings):
         ('mC0b',                   ([],    'dct')),
         ('zG00 node_sort',         (None,  'arr')),
         ('zG00 node_sort_inv',     (None,  'dct')),
-        ('zL00 node_up',           (None,  'dct')),
-        ('zL00 node_down',         (None,  'dct')),
+        ('zL00 node_up',           (None,  'arr')),
+        ('zL00 node_down',         (None,  'arr')),
         ('zV00 verses',            (None,  'dct')),
         ('zV00 books_la',          (None,  'dct')),
+        ('zV00 passages',          (None,  'dct')),
     ))
     _data_items_tpl_a = ((
         ('Xnf',                   ([],    'dct')),
@@ -174,7 +178,7 @@ class Names(Settings):
             docc = Names.decomp(dkey)[0]
             if docc not in req_items and dkey not in prepare_dict: continue
             if dkey in prepare_dict:
-                self.setenv(zspace=prepare_dict[dkey][-1])
+                self.setenv(zspace=prepare_dict[dkey][3])
                 self.req_data_items[dkey] = self.dinfo(dkey)
                 dkeys['prep'].add(dkey)
             elif docc in req_items and req_items[docc] == True:
@@ -208,7 +212,7 @@ class Names(Settings):
         else:
             dloc = self.env['{}_compiled_dir'.format(dorigin)]
         dfile = Names.comp_file(dgroup, dkind, ddir, dcomps)
-        return (dgroup not in 'FC', dloc, dfile, dtype, dorigin == 'z')
+        return (dgroup not in 'FCE', dloc, dfile, dtype, dorigin == 'z')
 
     def check_load_spec(load_spec, stamp):
         errors = []
@@ -225,7 +229,7 @@ class Names(Settings):
                             errors.append('under {} and then {} only these values are allowed: {}, not {}'.format(key, subkey, Names.kind_types, val))
             elif key == 'primary':
                 val = load_spec[key]
-                if val not in {False, True}:
+                if val not in {False, True, 'mmap'}:
                     errors.append('under {} only these values are allowed: {}, not {}'.format(key, Names.kind_types, val))
             elif key == 'features':
                 val = load_spec[key]
@@ -33,8 +33,8 @@ def init():
 
     unlinked_nodes = 0
     linked_nodes = 0
-    region_begin = array.array('I')
-    region_end = array.array('I')
+    region_begin = array.array('Q')
+    region_end = array.array('Q')
     node_region_list = []
     edges_from = array.array('I')
     edges_to = array.array('I')
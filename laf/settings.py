@@ -3,7 +3,7 @@ import configparser
 from .timestamp import Timestamp
 
 NAME = 'LAF-Fabric'
-VERSION = '4.8.4'
+VERSION = '4.9'
 APIREF = 'http://laf-fabric.readthedocs.org/en/latest/texts/API-reference.html'
 FEATDOC = 'https://shebanq.ancient-data.org/static/docs/featuredoc/texts/welcome.html'
 MAIN_CFG = 'laf-fabric.cfg'
@@ -49,6 +49,7 @@ class Settings(object):
         'm_compiled_path':       '{data_dir}/{source}/{bin_subdir}/{log_name}{compile_name}.{text_ext}',
         'primary_compiled_path': '{data_dir}/{source}/{bin_subdir}/{primary_data}',
         'z_compiled_dir':        '{data_dir}/{source}/{bin_subdir}/Z/{zspace}',
+        'mmap_dir':              '{data_dir}/{source}/{bin_subdir}/Z/_mmap',
         'task_dir':              '{output_dir}/{source}/{task}',
         'log_path':              '{output_dir}/{source}/{task}/{log_name}{task}.{text_ext}',
     }
@@ -138,6 +139,10 @@ class Settings(object):
         self.zspace = ''
         return True
 
+    def z_compiled_dir(self, zspace):
+        '''the directory of the data prepared in zspace, as setenv would make it, without changing self.env'''
+        return self._env_def['z_compiled_dir'].format(source=self.env.get('source'), task=self.env.get('task'), zspace=zspace, **self._myconfig)
+
     def setenv(self, source=None, annox=None, task=None, zspace=None):
         '''all relevant config settings will be stored in self.env
         Most settings are just key - string value pairs.
@@ -0,0 +1,85 @@
+import sys
+import time
+import array
+import random
+
+from laf import backend
+from laf.elements import INT_MISSING
+
+if len(sys.argv) > 1 and sys.argv[1] == 'graph':
+    from laf.fabric import LafFabric
+    from laf import graph
+    fabric = LafFabric(verbose='SILENT')
+    API = fabric.load('etcbc4', '--', 'bench', {"features": ("otype", "mother")}, verbose='SILENT')
+    (C, Ci, F) = (API['C'], API['Ci'], API['F'])
+    clauses = list(F.otype.s('clause'))
+    tasks = (
+        ('array form of the mother edges', lambda: (C.mother.arrays(), Ci.mother.arrays())),
+        ('degree statistics', lambda: graph.degree_stats(Ci.mother)),
+        ('connected components', lambda: graph.components(C.mother)),
+        ('descendants of all clauses', lambda: [graph.closure(Ci.mother, c) for c in clauses]),
+        ('2-hop neighbourhood of all clauses', lambda: graph.neighbourhood(Ci.mother, clauses, 2)),
+        ('end nodes of all clauses', lambda: C.mother.endnodes_many(clauses)),
+    )
+    for (name, task) in tasks:
+        t = time.time()
+        task()
+        print('{:<40} {:>8.3f}s'.format(name, time.time() - t))
+    sys.exit()
+
+if len(sys.argv) > 1 and sys.argv[1] == 'transcription':
+    from laf.fabric import LafFabric
+    from etcbc.lib import Transcription
+    fabric = LafFabric(verbose='SILENT')
+    API = fabric.load('etcbc4', '--', 'bench', {"features": ("otype g_word g_word_utf8 lex", "")}, verbose='SILENT')
+    F = API['F']
+    words = [F.g_word.v(w) for w in F.otype.s('word')]
+    words_utf8 = [F.g_word_utf8.v(w) for w in F.otype.s('word')]
+    lexicon = sorted(set(F.lex.v(w) for w in F.otype.s('word')))
+    tasks = (
+        ('to_hebrew', Transcription.to_hebrew, words),
+        ('to_hebrew_v', Transcription.to_hebrew_v, words),
+        ('to_hebrew_c', Transcription.to_hebrew_c, words),
+        ('to_etcbc_v', Transcription.to_etcbc_v, words),
+        ('to_etcbc_c', Transcription.to_etcbc_c, words),
+        ('from_hebrew', Transcription._from_hebrew, words_utf8),
+        ('to_hebrew (lexicon)', Transcription.to_hebrew, lexicon),
+        ('to_etcbc_c (lexicon)', Transcription.to_etcbc_c, lexicon),
+    )
+    print('{} words, {} lexemes'.format(len(words), len(lexicon)))
+    for (name, task, items) in tasks:
+        task.cache_clear()
+        for label in ('first', 'again'):
+            t = time.time()
+            for x in items: task(x)
+            d = time.time() - t
+            print('{:<24} {:<6} {:>8.3f}s {:>12.0f} words/s'.format(name, label, d, len(items) / d if d else 0))
+    sys.exit()
+
+n_node = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+random.seed(1)
+
+node_anchor_min = array.array('I', (random.randrange(1, 2 * n_node) for n in range(n_node)))
+node_anchor_max = array.array('I', (a + random.randrange(0, 50) for a in node_anchor_min))
+nodes = array.array('I', range(n_node))
+node_sort = backend.sort_by_interval(nodes, node_anchor_min, node_anchor_max)
+node_sort_inv = dict((n, i) for (i, n) in enumerate(node_sort))
+some_nodes = random.sample(range(n_node), n_node // 10)
+column = array.array('q', (random.randrange(0, 1000) if n % 3 else INT_MISSING for n in range(n_node)))
+
+tasks = (
+    ('sort nodes by anchors', lambda: list(backend.sort_by_interval(nodes, node_anchor_min, node_anchor_max))),
+    ('canonical order of 10% of the nodes', lambda: list(backend.canonical(some_nodes, node_sort, node_sort_inv))),
+    ('sorted index of an integer feature', lambda: tuple(list(x) for x in backend.sort_by_value(column, INT_MISSING))),
+)
+
+print('{} nodes, NumPy {}'.format(n_node, 'not available' if backend.numpy == None else backend.numpy.__version__))
+for (name, task) in tasks:
+    results = {}
+    for on in (False, True):
+        if backend.use_numpy(on) != on: continue
+        t = time.time()
+        results[on] = task()
+        print('{:<40} {:<6} {:>8.3f}s'.format(name, 'numpy' if on else 'python', time.time() - t))
+    if len(results) == 2 and results[False] != results[True]: print('DIFFERENT RESULTS for {}'.format(name))
+backend.use_numpy(True)
@@ -57,7 +57,7 @@ def do_tasks():
                         fh = outfile(fname)
                         i += 1
                         print('{:>2} - task {}'.format(i, fname))
-                        fh.write(T.text(**p, fmt=fmt, html=html, verse_label=lb, style=default_style if styled else tweak_style))
+                        T.write(fh, **p, fmt=fmt, html=html, verse_label=lb, style=default_style if styled else tweak_style)
                         fh.close()
 
 do_tasks()
@@ -3,12 +3,25 @@ import os
 import time
 import glob
 import collections
+import re
+import array
+import functools
+import weakref
+import gc
 from contextlib import contextmanager
 import unittest
 
 from laf.fabric import LafFabric
 from laf.names import FabricError
+from laf.elements import INT_MISSING, overlay
+from laf.lib import array_code, narrow_array, regex_prefix
+from laf import backend
+from laf import graph
 from etcbc.preprocess import prepare
+from etcbc.preprocess import otypes
+from etcbc import preprocess
+from etcbc.lib import monad_set, MonadSet, Transcription
+from etcbc.text import Text
 
 SOURCE = 'etcbc4'
 ANNOX = 'px'
@@ -69,7 +82,7 @@ class TestLafFabric(unittest.TestCase):
             if os.path.getmtime(f) < now: newer = False
         self.assertTrue(newer)
         self.assertTrue(the_log)
-        self.assertEqual(found, 44)
+        self.assertEqual(found, 47)
         close()
         API = self.fabric.load_again({}, compile_main=False)
         close = API['close']
@@ -265,6 +278,116 @@ class TestLafFabric(unittest.TestCase):
         expected = '''[בְּ][רֵאשִׁ֖ית][בָּרָ֣א][אֱלֹהִ֑ים][אֵ֥ת][הַ][שָּׁמַ֖יִם][וְ][אֵ֥ת][הָ][אָֽרֶץ][אֶתֵּ֤ן][בַּ][][מִּדְבָּר֙][אֶ֣רֶז][שִׁטָּ֔ה][וַ][הֲדַ֖ס][וְ][עֵ֣ץ][שָׁ֑מֶן][אָשִׂ֣ים][בָּ][][עֲרָבָ֗ה][בְּרֹ֛ושׁ][תִּדְהָ֥ר][וּ][תְאַשּׁ֖וּר][יַחְדָּֽו]'''
         self.assertEqual(text, expected)
 
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_e210_primary_batch(self):
+        API = self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype",""), "primary": True})
+        NN = API['NN']
+        P = API['P']
+        close = API['close']
+        the_nodes = list(NN())
+        chunks = [P.data(n) for n in the_nodes]
+        text = P.text(the_nodes, sep='|')
+        all_text = P.all_data
+        self.assertEqual(P.data_many(the_nodes), chunks)
+        self.assertEqual(text, '|'.join(''.join(c[1] for c in cs) for cs in chunks if cs != None))
+        close()
+
+        API = self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype",""), "primary": 'mmap'})
+        P = API['P']
+        close = API['close']
+        self.assertNotIsInstance(P.all_data, str)
+        self.assertEqual(len(P.all_data), len(all_text))
+        self.assertEqual(str(P.all_data), all_text)
+        for (b, e) in ((0, 1), (3, 70), (60, 200), (-5, None), (len(all_text), None)):
+            self.assertEqual(P.all_data[b:e], all_text[b:e])
+        self.assertEqual(P.data_many(the_nodes), chunks)
+        self.assertEqual(P.text(the_nodes, sep='|'), text)
+        mapped = P.all_data
+        mmap_dir = "{}/{}/bin/Z/_mmap".format(DATADIRA, SOURCE)
+        side_files = glob.glob('{}/*'.format(mmap_dir))
+        self.assertEqual(len(side_files), 2)
+        self.assertFalse([f for f in glob.glob("{}/{}/bin/*".format(DATADIRA, SOURCE)) if f.endswith(('.utf8', '.utf8idx'))])
+        for f in side_files: os.utime(f, (0, 0))
+        close()
+        API = self.fabric.load_again({"features": ("otype",""), "primary": True})
+        API['close']()
+        API = self.fabric.load_again({"features": ("otype",""), "primary": 'mmap'})
+        P = API['P']
+        close = API['close']
+        self.assertTrue(all(os.path.getmtime(f) > 0 for f in side_files))
+        self.assertEqual(str(mapped), all_text)
+        self.assertEqual(str(P.all_data), all_text)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_e220_text_search(self):
+        API = self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype",""), "primary": True})
+        F = API['F']
+        P = API['P']
+        close = API['close']
+        all_text = P.all_data
+        for string in ('אֵ֥ת', 'ו', 'וְאֵ֥ת הָ', 'nonexistent'):
+            self.assertEqual(list(P.find(string)), [i for i in range(len(all_text)) if all_text.startswith(string, i)])
+        for pattern in ('אֵ֥ת\\s+\\S+', 'הָ\\S*', 'ה|ו', '\\s'):
+            self.assertEqual(P.search(pattern), [m.span() for m in re.finditer(pattern, all_text)])
+        hits = P.search('אֵ֥ת')
+        self.assertEqual(len(hits), 2)
+        for (start, end) in hits:
+            words = P.containing(start, end, test=F.otype.v, value='word')
+            self.assertEqual(len(words), 1)
+            self.assertEqual(P.text(words), 'אֵ֥ת')
+            self.assertEqual(len(P.containing(start, end, test=F.otype.v, value='verse')), 1)
+            self.assertEqual(P.containing(start, end + 3, test=F.otype.v, value='word'), [])
+        self.assertEqual([regex_prefix(p, f) for (p, f) in (('וְאֵ֥ת הָ', 0), ('וְאֵ֥ת הָ', re.VERBOSE), ('(?x)וְאֵ֥ת הָ', 0), ('וְאֵ֥ת', re.I))], ['וְאֵ֥ת הָ', '', '', ''])
+        self.assertEqual(P.search('וְ אֵ֥ת', re.VERBOSE), [m.span() for m in re.finditer('וְאֵ֥ת', all_text)])
+        self.assertEqual(len(P.search('וְ אֵ֥ת', re.VERBOSE)), 1)
+        close()
+
+        API = self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype",""), "primary": 'mmap'})
+        P = API['P']
+        close = API['close']
+        (P.BLOCK, P.CONTEXT) = (16, 4)
+        for pattern in ('אֵ֥ת\\s+\\S+', 'הָ\\S*', 'ה|ו', '\\s', '(?<=ת)\\s', '\\S$', '^\\S', ''):
+            self.assertEqual(P.search(pattern), [m.span() for m in re.finditer(pattern, all_text)])
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_e250_array_widths(self):
+        self.assertEqual([array_code(x) for x in (0, 255, 256, 65535, 65536, (1 << 32) - 1, 1 << 32)], ['B', 'B', 'H', 'H', 'I', 'I', 'Q'])
+        data = array.array('I', [3, 0, 200])
+        self.assertEqual(narrow_array(data).typecode, 'B')
+        self.assertEqual(list(narrow_array(data)), list(data))
+        API = self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype",""), "primary": True})
+        data_items = API['data_items']
+        close = API['close']
+        self.assertEqual(data_items['mP00(node_events_k)'].typecode, 'B')
+        self.assertEqual(set(data_items['mP00(node_events_k)']), {0, 1, 2, 3})
+        for dkey in data_items:
+            if type(data_items[dkey]) is array.array: self.assertIs(narrow_array(data_items[dkey]), data_items[dkey])
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_e260_backend(self):
+        node_anchor_min = array.array('I', [5, 1, 5, 3, 1, 0, 5])
+        node_anchor_max = array.array('I', [9, 4, 6, 3, 4, 0, 9])
+        node_sort = array.array('I', [4, 1, 3, 0, 6, 2])
+        node_sort_inv = dict((n, i) for (i, n) in enumerate(node_sort))
+        long_sort = array.array('I', range(999, -1, -1))
+        long_sort_inv = dict((n, i) for (i, n) in enumerate(long_sort))
+        column = array.array('q', [7, -2, 7, 0, INT_MISSING, 3])
+        results = {}
+        for on in (False, True):
+            if backend.use_numpy(on) != on: continue
+            results[on] = (
+                list(backend.sort_by_interval(array.array('I', [0, 1, 2, 3, 4, 6]), node_anchor_min, node_anchor_max)),
+                list(backend.canonical([6, 1, 2], node_sort, node_sort_inv)),
+                list(backend.canonical([7, 300, 2], long_sort, long_sort_inv)),
+                [list(x) for x in backend.sort_by_value(column, INT_MISSING)],
+            )
+        backend.use_numpy(True)
+        self.assertEqual(results[False], ([1, 4, 3, 0, 6, 2], [1, 6, 2], [300, 7, 2], [[1, 3, 5, 0, 2], [-2, 0, 3, 7, 7]]))
+        if True in results: self.assertEqual(results[True], results[False])
+
     @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
     def test_e300_lingo(self):
         API = self.fabric.load(SOURCE, '--', 'lingo', {"features": ("otype",""), "primary": True})
@@ -701,6 +824,21 @@ class TestLafFabric(unittest.TestCase):
         self.assertEqual(text, expected)
         close()
 
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u110_int_features(self):
+        API = self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype minmonad maxmonad book", "")})
+        F = API['F']
+        close = API['close']
+        nodes = list(F.minmonad.s())
+        for n in nodes:
+            self.assertEqual(F.minmonad.i(n), int(F.minmonad.v(n)))
+        self.assertEqual(F.minmonad.i(max(nodes) + 1), None)
+        for (low, high) in ((None, None), (3, 7), (5, 5), (None, 2), (20, None), (7, 3)):
+            expected = sorted((n for n in nodes if (low == None or F.minmonad.i(n) >= low) and (high == None or F.minmonad.i(n) <= high)), key=lambda n: (F.minmonad.i(n), n))
+            self.assertEqual(list(F.minmonad.r(low, high)), expected)
+        self.assertRaises(FabricError, F.book.i, nodes[0])
+        close()
+
     @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
     def test_u210_node_order(self):
         API = self.fabric.load(SOURCE, '--', 'n_prep', {"features": ("otype","")})
@@ -717,6 +855,266 @@ class TestLafFabric(unittest.TestCase):
         close()
         for (i, n) in enumerate(NN()): self.assertEqual(n, expected_nodes[i])
 
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u215_etcbc_order(self):
+        API = self.fabric.load(SOURCE, '--', 'n_prep', {"features": ("otype monads",""), "prepare": prepare})
+        NN = API['NN']
+        F = API['F']
+        close = API['close']
+        def before(a, b):
+            (sa, sb) = (monad_set(F.monads.v(a)), monad_set(F.monads.v(b)))
+            (oa, ob) = (otypes.index(F.otype.v(a)), otypes.index(F.otype.v(b)))
+            if sa == sb: return 0 if oa == ob else -1 if oa < ob else 1
+            if sa < sb: return 1
+            if sa > sb: return -1
+            return -1 if min(sa - sb) < min(sb - sa) else 1
+        nodes = list(NN())
+        self.assertEqual(nodes, sorted(sorted(nodes), key=functools.cmp_to_key(before)))
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u220_extrakey(self):
+        API = self.fabric.load(SOURCE, '--', 'n_prep', {"features": ("otype","")})
+        NN = API['NN']
+        F = API['F']
+        close = API['close']
+        rank = dict((t, r) for (r, t) in enumerate((
+            'book', 'chapter', 'verse', 'half_verse', 'sentence', 'sentence_atom',
+            'clause', 'clause_atom', 'phrase', 'phrase_atom', 'subphrase', 'word',
+        )))
+        calls = collections.Counter()
+        def by_rank(n):
+            calls[by_rank] += 1
+            return rank[F.otype.v(n)]
+        expected_nodes = (79, 80, 81, 31, 32, 33, 34, 82, 35, 39, 0, 1, 36, 40, 2, 37, 41, 3, 83, 38, 42, 43, 4, 5, 6, 7, 44, 8, 9, 10, 45, 47, 49, 51, 53, 60, 11, 54, 61, 12, 14, 13, 55, 62, 67, 68, 69, 15, 70, 16, 17, 71, 18, 19, 72, 73, 20, 74, 21, 46, 48, 50, 52, 56, 63, 22, 57, 64, 23, 25, 24, 58, 65, 75, 76, 26, 77, 27, 28, 78, 29, 59, 66, 30, 84, 85, 86, 87, 88)
+        self.assertEqual(tuple(NN(extrakey=by_rank)), expected_nodes)
+        sorted_once = calls[by_rank]
+        self.assertEqual(tuple(NN(extrakey=by_rank)), expected_nodes)
+        self.assertEqual(calls[by_rank], sorted_once)
+        self.assertEqual(tuple(NN(nodes=expected_nodes[10:], extrakey=by_rank)), expected_nodes[10:])
+        for i in range(self.fabric.lafapi.resorted_size): list(NN(extrakey=lambda n: rank[F.otype.v(n)]))
+        calls.clear()
+        self.assertEqual(tuple(NN(extrakey=by_rank)), expected_nodes)
+        self.assertEqual(calls[by_rank], sorted_once)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u230_cached_events(self):
+        API = self.fabric.load(SOURCE, '--', 'lingo', {"features": ("otype",""), "primary": True})
+        NE = API['NE']
+        F = API['F']
+        close = API['close']
+        def words(n): return F.otype.v(n) == 'word'
+        def no_words(n): return F.otype.v(n) != 'word'
+        for spec in ({}, {"key": no_words}, {"key": no_words, "simplify": words}):
+            expected = [(a, list(e)) for (a, e) in NE(**spec)]
+            self.assertTrue(len(expected) > 0)
+            self.assertNotEqual(expected[-1][0], -1)
+            self.assertEqual([(a, list(e)) for (a, e) in NE(cache=True, **spec)], expected)
+            self.assertEqual([(a, list(e)) for (a, e) in NE(cache=True, **spec)], expected)
+        calls = collections.Counter()
+        def counted(n):
+            calls[counted] += 1
+            return no_words(n)
+        list(NE(key=counted, cache=True))
+        computed_once = calls[counted]
+        list(NE(key=counted, cache=True))
+        self.assertEqual(calls[counted], computed_once)
+        for i in range(self.fabric.lafapi.event_streams_size): list(NE(key=lambda n: no_words(n), cache=True))
+        calls.clear()
+        list(NE(key=counted, cache=True))
+        self.assertEqual(calls[counted], computed_once)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u240_anchor_windows(self):
+        API = self.fabric.load(SOURCE, '--', 'lingo', {"features": ("otype",""), "primary": True})
+        NN = API['NN']
+        NE = API['NE']
+        NA = API['NA']
+        F = API['F']
+        close = API['close']
+        all_nodes = list(NN())
+        all_events = [(a, list(e)) for (a, e) in NE()]
+        def words(n): return F.otype.v(n) == 'word'
+        simplified_events = [(a, list(e)) for (a, e) in NE(simplify=words)]
+        for n in NN(test=F.otype.v, values=['verse', 'clause', 'word']):
+            (start, end) = NA(n)
+            expected_nodes = [m for m in all_nodes if start <= NA(m)[0] and NA(m)[1] <= end]
+            self.assertTrue(n in expected_nodes)
+            self.assertEqual(list(NN(anchor_range=(start, end))), expected_nodes)
+            self.assertEqual(list(NN(nodes=reversed(all_nodes), anchor_range=(start, end))), expected_nodes)
+            expected_events = [(a, e) for (a, e) in all_events if start <= a <= end]
+            self.assertEqual([(a, list(e)) for (a, e) in NE(start_anchor=start, end_anchor=end)], expected_events)
+            self.assertEqual([(a, list(e)) for (a, e) in NE(start_anchor=start, end_anchor=end, cache=True)], expected_events)
+            self.assertEqual(
+                [(a, list(e)) for (a, e) in NE(start_anchor=start, end_anchor=end, simplify=words)],
+                [(a, e) for (a, e) in simplified_events if start <= a <= end],
+            )
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u250_anchor_index(self):
+        API = self.fabric.load(SOURCE, '--', 'lingo', {"features": ("otype",""), "primary": True})
+        NN = API['NN']
+        NA = API['NA']
+        A = API['A']
+        close = API['close']
+        all_nodes = list(NN())
+        positions = sorted(set(p + d for n in all_nodes for p in NA(n) for d in (-1, 0, 1)))
+        for p in positions:
+            self.assertEqual(A.stab(p), [n for n in all_nodes if NA(n)[0] <= p < NA(n)[1]])
+        for (start, end) in zip(positions, positions[5:]):
+            self.assertEqual(A.overlap(start, end), [n for n in all_nodes if NA(n)[0] < end and NA(n)[1] > start and NA(n)[0] < NA(n)[1]])
+            self.assertEqual(A.within(start, end), [n for n in all_nodes if start <= NA(n)[0] and NA(n)[1] <= end])
+        self.assertEqual(A.stab(0), [79, 80, 81, 31, 32, 33, 34, 82, 35, 39, 0])
+        self.assertEqual(A.stab(0, gaps=True), [79, 80, 81, 31, 32, 33, 34, 82, 35, 39, 0])
+        self.assertEqual(A.stab(182), [79, 80, 46, 48, 50, 52])
+        self.assertEqual(A.stab(182, gaps=True), [79, 80])
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u260_embedding(self):
+        API = self.fabric.load(SOURCE, '--', 'lingo', {"features": ("otype",""), "primary": True})
+        NN = API['NN']
+        NA = API['NA']
+        A = API['A']
+        close = API['close']
+        all_nodes = list(NN())
+        for (i, n) in enumerate(all_nodes):
+            (start, end) = NA(n)
+            containers = [m for m in all_nodes[0:i] if NA(m)[0] <= start and end <= NA(m)[1]]
+            self.assertEqual(A.u(n), containers[-1] if containers else None)
+            self.assertEqual(A.d(n), tuple(m for m in all_nodes if A.u(m) == n))
+        self.assertEqual(A.u(79), None)
+        self.assertEqual(A.d(79), (80,))
+        self.assertEqual(A.u(0), 39)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u270_layer(self):
+        API = self.fabric.load(SOURCE, '--', 'layer', {"features": ("otype monads",""), "prepare": prepare})
+        NN = API['NN']
+        F = API['F']
+        L = API['L']
+        close = API['close']
+        for dkey in ('zL00(node_up)', 'zL00(node_down)'): self.assertIn(API['data_items'][dkey].typecode, 'BHIQ')
+        all_nodes = list(NN())
+        monads = dict((n, monad_set(F.monads.v(n))) for n in all_nodes)
+        for (r, tp) in enumerate(otypes):
+            containers = [m for m in all_nodes if F.otype.v(m) == tp]
+            for n in all_nodes:
+                ntp = F.otype.v(n)
+                if otypes.index(ntp) <= r: continue
+                found = [m for m in containers if all_nodes.index(m) < all_nodes.index(n) and monads[n] <= monads[m]]
+                self.assertEqual(L.u(tp, n), found[-1] if found else None)
+            for m in containers:
+                for ntp in otypes[r + 1:]:
+                    contained = [n for n in all_nodes if F.otype.v(n) == ntp and monads[n] <= monads[m] and all_nodes.index(m) < all_nodes.index(n)]
+                    self.assertEqual(L.d(ntp, m), contained if contained else None)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u275_layer_prepare(self):
+        API = self.fabric.load(SOURCE, '--', 'layer', {"features": ("otype monads",""), "prepare": prepare})
+        expected = dict((dkey, list(API['data_items'][dkey])) for dkey in ('zL00(node_up)', 'zL00(node_down)'))
+        API['close']()
+        zdir = "{}/{}/bin/Z/etcbc".format(DATADIRA, SOURCE)
+        for (remove, stale) in (('L00(node_up)', False), ('L00(node_down)', False), ('L00(node_down)', True)):
+            now = time.time()
+            time.sleep(1)
+            self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype","")})['close']()
+            os.remove('{}/{}'.format(zdir, remove))
+            if stale: preprocess.down_handover['down'] = (array.array('I'), array.array('I'))
+            API = self.fabric.load(SOURCE, '--', 'layer', {"features": ("otype monads",""), "prepare": prepare})
+            for dkey in expected: self.assertEqual(list(API['data_items'][dkey]), expected[dkey])
+            self.assertEqual(os.path.getmtime('{}/L00(node_down)'.format(zdir)) > now, True)
+            self.assertEqual(preprocess.down_handover, {})
+            API['close']()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u280_passages(self):
+        API = self.fabric.load(SOURCE, '--', 'layer', {"features": ("otype",""), "prepare": prepare})
+        F = API['F']
+        L = API['L']
+        close = API['close']
+        levels = (('chapter', F.sft_chapter.v), ('verse', F.sft_verse.v), ('sentence', F.number.v), ('clause', F.number.v), ('phrase', F.number.v))
+        for bn in F.otype.s('book'):
+            for (tp, feat) in levels:
+                for n in L.d(tp, bn) or ():
+                    self.assertEqual(L.inside(tp, feat(n), bn), [m for m in L.d(tp, bn) if feat(m) == feat(n)])
+        for clause in (None, 1, 2):
+            for phrase in (None, 1, 2):
+                expected = []
+                for bn in F.otype.s('book'):
+                    if F.book.v(bn) != 'Genesis': continue
+                    drill = [v for v in L.d('verse', bn) or () if F.verse.v(v) == '1']
+                    if clause != None: drill = [c for v in drill for c in L.d('clause', v) or () if F.number.v(c) == str(clause)]
+                    if phrase != None: drill = [p for c in drill for p in L.d('phrase', c) or () if F.number.v(p) == str(phrase)]
+                    expected.extend(w for x in drill for w in L.d('word', x) or ())
+                self.assertEqual(L.p('word', book='Genesis', verse=1, clause=clause, phrase=phrase), expected)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u285_verse_nodes(self):
+        T = Text.__new__(Text)
+        T.lafapi = type('lafapi', (), {'api': {'msg': lambda m: None}})()
+        T._book_node = {'en': {'Genesis': 0, 'Exodus': 1}}
+        T._verse_order = {0: ((1, 1, 11), (1, 2, 12), (1, 3, 13), (2, 1, 21), (2, 2, 22), (2, 3, 23), (2, 4, 24), (3, 1, 31), (3, 2, 32))}
+        for (passage, expected) in (
+            ('Genesis', [11, 12, 13, 21, 22, 23, 24, 31, 32]),
+            ('Gen 2', [21, 22, 23, 24]),
+            ('Genesis 1-2', [11, 12, 13, 21, 22, 23, 24]),
+            ('Genesis 2:3', [23]),
+            ('Genesis 1:2-3', [12, 13]),
+            ('Genesis 1:3-2:2', [13, 21, 22]),
+            ('Genesis 1-2:3', [11, 12, 13, 21, 22, 23]),
+            ('Genesis 2-3:1', [21, 22, 23, 24, 31]),
+            ('Ex 1', []),
+            ('Nothing 1', []),
+        ):
+            self.assertEqual(T.verse_nodes(passage), expected)
+        T.lafapi.api['L'] = type('L', (), {'u': lambda self, t, n: 0})()
+        T.lafapi.api['F'] = type('F', (), {'sft_chapter': type('f', (), {'v': lambda self, n: str(n // 10)})()})()
+        T._book_name = {'en': {0: 'Genesis', 1: 'Exodus'}}
+        self.assertEqual(list(T._verse_groups(None, 1, 1, 'en', 'Gen 1:2-3')), [[('Genesis', '1', 12), ('Genesis', '1', 13)]])
+        self.assertEqual(list(T._verse_groups(None, None, None, 'en', 'Ex 1')), [])
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u290_prepare_order(self):
+        lafapi = self.fabric.lafapi
+        prepare_dict = getattr(lafapi, 'prepare_dict', {})
+        lafapi.prepare_dict = collections.OrderedDict((
+            ('zV00(a)', (None, None, False, 'x', dict(depends=('zV00(c)',)))),
+            ('zV00(b)', (None, None, False, 'x')),
+            ('zV00(c)', (None, None, False, 'x', dict(depends=('zV00(b)',)))),
+            ('zV00(d)', (None, None, False, 'x', dict(depends=('zV00(d)',)))),
+        ))
+        try:
+            self.assertEqual(lafapi._prep_order(['zV00(a)', 'zV00(b)', 'zV00(c)']), ['zV00(b)', 'zV00(c)', 'zV00(a)'])
+            self.assertEqual(lafapi._prep_order(['zV00(a)', 'zV00(c)']), ['zV00(c)', 'zV00(a)'])
+            self.assertRaises(FabricError, lafapi._prep_order, ['zV00(a)', 'zV00(d)'])
+        finally:
+            lafapi.prepare_dict = prepare_dict
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u295_prepare_inputs(self):
+        self.fabric.load(SOURCE, '--', 'plain', {"features": ("otype","")})['close']()
+        lafapi = self.fabric.lafapi
+        prepare_dict = getattr(lafapi, 'prepare_dict', {})
+        lafapi.prepare_dict = collections.OrderedDict((
+            ('zL00(node_up)', (None, None, False, 'x', dict(depends=('zG00(node_sort)',)))),
+            ('zG00(node_sort)', (None, None, False, 'y')),
+        ))
+        env = lafapi.names.env
+        (zspace, annox) = (env['zspace'], env['annox'])
+        try:
+            self.assertEqual(lafapi._prep_inputs('zL00(node_up)'), ["{}/{}/bin/Z/y/G00(node_sort)".format(DATADIRA, SOURCE)])
+            self.assertEqual(env['zspace'], zspace)
+            self.assertIs(env['annox'], annox)
+        finally:
+            lafapi.prepare_dict = prepare_dict
+
     @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
     def test_u310_edge_features(self):
         API = self.fabric.load(SOURCE, ANNOX, 'edges', {"features": ("", "dirk:part.sectioning"), "prepare": prepare})
@@ -731,6 +1129,23 @@ class TestLafFabric(unittest.TestCase):
             i += 1
         close()
 
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u315_annox_overlay(self):
+        API = self.fabric.load(SOURCE, ANNOX, 'overlay', {"features": ("etcbc4:db.otype dirk:db.otype", "dirk:part.sectioning")})
+        NN = API['NN']
+        F = API['F']
+        C = API['C']
+        close = API['close']
+        feature = F.dirk_db_otype
+        for n in NN(): self.assertEqual(feature.v(n), feature.alookup.get(n, feature.V(n)))
+        self.assertEqual(sorted(C.sectioning.v(81)), [82, 83])
+        merged = feature.data
+        close()
+        API = self.fabric.load_again({"features": ("etcbc4:db.otype dirk:db.otype", "")}, annox=ANNOX)
+        close = API['close']
+        self.assertTrue(API['F'].dirk_db_otype.data is merged)
+        close()
+
     @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
     def test_u320_unmarked_edges(self):
         API = self.fabric.load(SOURCE, ANNOX, 'u_edges', {"features": ("", "dirk:part.sectioning laf:.x laf:.y"), "prepare": prepare})
@@ -806,6 +1221,194 @@ class TestLafFabric(unittest.TestCase):
                 self.assertEqual(the_endtypes, exp_s)
         close()
 
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u340_endnodes_many(self):
+        API = self.fabric.load(SOURCE, '--', 'plain', {
+                "xmlids": {"node": True, "edge": True},
+                "features": ("otype", "functional_parent"),
+                "prepare": prepare,
+            },
+            compile_main=False, compile_annox=False,
+        )
+        NN = API['NN']
+        Ci = API['Ci']
+        close = API['close']
+        the_nodes = list(NN())
+        the_edge = Ci.functional_parent
+        memo_size = the_edge.memo_size
+        the_edge.memo_size = 5
+        many = the_edge.endnodes_many(the_nodes)
+        self.assertEqual(set(many), set(the_nodes))
+        for n in the_nodes:
+            self.assertEqual(set(the_edge.endnodes([n])), many[n])
+            the_end = set()
+            next_set = {n}
+            while next_set:
+                m = next_set.pop()
+                nexts = set(the_edge.v(m))
+                if nexts: next_set |= nexts
+                else: the_end.add(m)
+            self.assertEqual(many[n], the_end)
+        self.assertEqual(set(the_edge.endnodes(the_nodes)), set().union(*many.values()))
+        self.assertEqual(the_edge.endnodes_many(the_nodes[0:3], value='nonexistent'), dict((n, {n}) for n in the_nodes[0:3]))
+        self.assertLessEqual(len(the_edge._memo[None]), 5)
+        the_edge.memo_size = memo_size
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u350_sorted_adjacency(self):
+        API = self.fabric.load(SOURCE, ANNOX, 'plain', {
+                "xmlids": {"node": True, "edge": True},
+                "features": ("otype", "functional_parent"),
+            },
+            compile_main=False, compile_annox=False,
+        )
+        NN = API['NN']
+        C = API['C']
+        Ci = API['Ci']
+        close = API['close']
+        order = self.fabric.lafapi.data_items['mG00(node_sort_inv)']
+        for the_edge in (C.functional_parent, Ci.functional_parent):
+            stored = dict((n, list(adj.items())) for (n, adj) in the_edge.lookup.items())
+            for (n, adj) in the_edge.lookup.items():
+                self.assertEqual(list(adj), sorted(adj, key=lambda m: order[m]))
+            for n in NN():
+                self.assertEqual(list(the_edge.v(n, sort=True)), sorted(the_edge.v(n), key=lambda m: order[m]))
+                self.assertEqual(list(the_edge.vv(n, sort=True)), sorted(the_edge.vv(n), key=lambda x: order[x[0]]))
+            self.assertEqual(dict((n, list(adj.items())) for (n, adj) in the_edge.lookup.items()), stored)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u355_annox_adjacency_order(self):
+        main = {1: {5: 'main5', 7: 'main7'}, 2: {5: 'main5'}}
+        layer = {1: {7: 'annox7', 9: 'annox9'}, 3: {5: 'annox5'}}
+        order = {9: 0, 7: 1, 5: 2}
+        merged = overlay(main, [layer], nested=True, order=order)
+        self.assertEqual(list(merged[1].items()), [(9, 'annox9'), (7, 'annox7'), (5, 'main5')])
+        self.assertEqual((merged[2], merged[3]), ({5: 'main5'}, {5: 'annox5'}))
+        self.assertEqual(main[1], {5: 'main5', 7: 'main7'})
+
+        API = self.fabric.load(SOURCE, ANNOX, 'plain', {
+                "features": ("otype", "mother dirk:part.sectioning"),
+                "prepare": prepare,
+            },
+            compile_main=False, compile_annox=False,
+        )
+        NN = API['NN']
+        C = API['C']
+        Ci = API['Ci']
+        close = API['close']
+        order = self.fabric.lafapi.data_items['mG00(node_sort_inv)']
+        for the_edge in (C.sectioning, Ci.sectioning, C.mother, Ci.mother):
+            for n in NN():
+                expected = {}
+                for layer in the_edge.layers: expected.update((layer or {}).get(n, {}))
+                self.assertEqual(dict(the_edge.vv(n)), expected)
+                self.assertEqual(list(the_edge.vv(n, sort=True)), sorted(expected.items(), key=lambda x: order[x[0]]))
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u360_graph(self):
+        API = self.fabric.load(SOURCE, '--', 'plain', {
+                "xmlids": {"node": True, "edge": True},
+                "features": ("otype", "functional_parent"),
+            },
+            compile_main=False, compile_annox=False,
+        )
+        NN = API['NN']
+        F = API['F']
+        C = API['C']
+        Ci = API['Ci']
+        close = API['close']
+        the_nodes = list(NN())
+        stats = graph.degree_stats(C.functional_parent)
+        self.assertEqual(stats['edges'], sum(C.functional_parent.e(n) for n in the_nodes))
+        self.assertEqual(stats['edges'], graph.degree_stats(Ci.functional_parent)['edges'])
+        self.assertEqual(sum(graph.degrees(Ci.functional_parent)), stats['edges'])
+        comp = graph.components(C.functional_parent)
+        self.assertEqual(list(comp), list(graph.components(Ci.functional_parent)))
+        for sentence in F.otype.s('sentence'):
+            (nodes, depths) = graph.closure(Ci.functional_parent, sentence)
+            the_depths = dict(zip(nodes, depths))
+            self.assertIn('word', set(F.otype.v(n) for n in nodes))
+            for n in nodes:
+                self.assertEqual(the_depths[n], 1 + the_depths.get(list(C.functional_parent.v(n))[0], 0))
+            for n in nodes:
+                self.assertEqual(comp[n], comp[sentence])
+                path = graph.shortest_path(C.functional_parent, n, sentence)
+                self.assertEqual(len(path), 1 + the_depths[n])
+                self.assertEqual(list(graph.closure(C.functional_parent, n)[0]), sorted(path[1:]))
+            self.assertEqual(list(graph.neighbourhood(Ci.functional_parent, [sentence], max(depths))), sorted(list(nodes) + [sentence]))
+            self.assertEqual(list(graph.neighbourhood(Ci.functional_parent, [sentence], 2)), sorted([n for n in nodes if the_depths[n] <= 2] + [sentence]))
+            self.assertEqual(list(graph.neighbourhood(Ci.functional_parent, [sentence], 0)), [sentence])
+            self.assertEqual(graph.shortest_path(Ci.functional_parent, nodes[0], sentence), None)
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u370_edge_index(self):
+        API = self.fabric.load(SOURCE, '--', 'plain', {
+                "xmlids": {"node": True, "edge": True},
+                "features": ("otype", "functional_parent"),
+            },
+            compile_main=False, compile_annox=False,
+        )
+        EE = API['EE']
+        FE = API['FE']
+        C = API['C']
+        Ci = API['Ci']
+        close = API['close']
+        the_edges = collections.defaultdict(list)
+        for (e, n, m) in EE():
+            x = FE.functional_parent.v(e)
+            if x != None: the_edges[x].append((e, n, m))
+        self.assertEqual(list(FE.functional_parent.s()), sorted(e for x in the_edges for (e, n, m) in the_edges[x]))
+        for x in the_edges:
+            the_pairs = [(n, m) for (e, n, m) in sorted(the_edges[x])]
+            edges = FE.functional_parent.s(x)
+            self.assertEqual(list(edges), sorted(e for (e, n, m) in the_edges[x]))
+            edges.append(0)
+            self.assertEqual(len(FE.functional_parent.s(x)), len(the_edges[x]))
+            (sources, targets) = C.functional_parent.pairs(x)
+            self.assertEqual(list(zip(sources, targets)), the_pairs)
+            (sources, targets) = Ci.functional_parent.pairs(x)
+            self.assertEqual(list(zip(targets, sources)), the_pairs)
+            for (n, m) in the_pairs: self.assertEqual(dict(C.functional_parent.vv(n))[m], x)
+        self.assertEqual(len(C.functional_parent.pairs()[0]), sum(len(es) for es in the_edges.values()))
+        self.assertEqual(list(FE.functional_parent.s('nonexistent')), [])
+        self.assertEqual(C.functional_parent.pairs('nonexistent'), (array.array('B'), array.array('B')))
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u380_edge_table(self):
+        API = self.fabric.load(SOURCE, '--', 'plain', {
+                "xmlids": {"node": True, "edge": True},
+                "features": ("otype", "functional_parent"),
+            },
+            compile_main=False, compile_annox=False,
+        )
+        EE = API['EE']
+        ET = API['ET']
+        F = API['F']
+        FE = API['FE']
+        close = API['close']
+        the_edges = list(EE())
+        for chunk in (1, 7, len(the_edges) + 1):
+            chunks = list(EE(chunk=chunk))
+            self.assertTrue(all(len(es) <= chunk for (es, fs, ts) in chunks))
+            self.assertEqual([x for c in chunks for x in zip(*c)], the_edges)
+        table = ET('functional_parent', node_features=('otype',))
+        rows = [
+            (e, n, m, FE.functional_parent.v(e), F.otype.v(n), F.otype.v(m))
+                for (e, n, m) in the_edges if FE.functional_parent.v(e) != None
+        ]
+        self.assertEqual(list(zip(table['edge'], table['from'], table['to'], table['value'], table['from.otype'], table['to.otype'])), rows)
+        value = rows[0][3]
+        table = ET('functional_parent', value=value)
+        self.assertEqual(sorted(table), ['edge', 'from', 'to', 'value'])
+        self.assertEqual(list(zip(table['edge'], table['value'])), [(r[0], r[3]) for r in rows if r[3] == value])
+        with self.assertRaises(FabricError): ET('functional_parent', node_features=('nonexistent',))
+        close()
+
     @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
     def test_u400_xml_ids(self):
         API = self.fabric.load(SOURCE, ANNOX, 'plain', {
@@ -940,6 +1543,46 @@ class TestLafFabric(unittest.TestCase):
         expected_anchors = [{1, 2, 3, 4}, {1, 2, 3}, {1, 2, 4}, {1, 2}, {1, 3, 4}, {1, 3}, {1, 4}, {1}, {2, 3, 4}, {2, 3}, {2, 4}, {2}, {3, 4}, {3}, {4}, set()]
         self.assertEqual(ordered_anchors, expected_anchors)
         close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u610_monad_set(self):
+        API = self.fabric.load(SOURCE, '--', 'before', {"features": ("", "")}) 
+        MK = API['MK']
+        close = API['close']
+
+        anchors = [set(), {1}, {2}, {3}, {4}, {1,2}, {1,3}, {1,4}, {2,3}, {2,4}, {3,4}, {1,2,3}, {1,2,4}, {1,3,4}, {2,3,4}, {1,2,3,4}]
+        monadsets = [MonadSet.from_monads(a) for a in anchors]
+        self.assertEqual([set(m) for m in sorted(monadsets, key=MK)], sorted(anchors, key=MK))
+        for (a, ma) in zip(anchors, monadsets):
+            self.assertEqual(len(ma), len(a))
+            if a: self.assertEqual(MonadSet.parse(str(ma)), ma)
+            for (b, mb) in zip(anchors, monadsets):
+                self.assertEqual((ma <= mb, ma < mb, ma == mb, set(ma | mb)), (a <= b, a < b, a == b, a | b))
+                self.assertEqual(ma.min_difference(mb), min(a - b) if a - b else None)
+        ms = MonadSet.parse('1-3,5,7-9')
+        self.assertEqual((ms.min(), ms.max(), len(ms), 4 in ms, 8 in ms), (1, 9, 7, False, True))
+        self.assertEqual(set(ms), monad_set('1-3,5,7-9'))
+        self.assertEqual(str(ms | MonadSet.parse('4,6')), '1-9')
+        close()
+
+    @unittest.skipIf(SPECIFIC, SPECIFIC_MSG)
+    def test_u620_transcription(self):
+        tr = Transcription()
+        word = 'B.:R;>CI73JT 00_S'
+        for i in range(2):
+            self.assertEqual(Transcription.to_etcbc_v(word), 'B.:R;>CIJT 00_S')
+            self.assertEqual(Transcription.to_etcbc_c(word), 'BR>#JT 00')
+            self.assertEqual(Transcription.to_hebrew(word), 'בְּרֵאשִׁ֖ית ׃ ס')
+            self.assertEqual(Transcription.to_hebrew_v(word), 'בְּרֵאשִׁית ׃ ס')
+            self.assertEqual(Transcription.to_hebrew_c(word), 'בראשית ׃')
+            self.assertEqual(tr.from_hebrew(Transcription.to_hebrew_v(word)), Transcription.to_etcbc_v(word).replace(' ', '_'))
+            self.assertEqual(Transcription.suffix_and_finales('B.:R;>CI73JT00_S'), ('B.:R;>CI73JT', '00 S \n'))
+            self.assertEqual(Transcription.ph_simplify('bᵊrēšˈîṯ *ʔᵉlōhˈîm bārā'), 'brēšîṯ ʔlōhîm bårå')
+            self.assertEqual(tr.from_syriac(tr.to_syriac('>BGD')), '>BGD')
+        the_tr = weakref.ref(tr)
+        del tr
+        gc.collect()
+        self.assertEqual(the_tr(), None)
         
 
 if __name__ == '__main__':
@@ -5,7 +5,7 @@ setup(
     package_data = {
         'emdros2laf': ['templates/*', 'xml/*'],
     },
-    version='4.8.4',
+    version='4.9',
     description='''Processor for Linguistic Annotation Framework ISO 24612:2012), applied to Biblical Hebrew''',
     author='Dirk Roorda',
     author_email='shebanq@ancient-data.org',